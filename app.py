@@ -1,32 +1,2178 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, simpledialog
+import argparse
+import base64
+from concurrent.futures import Future, ProcessPoolExecutor
 import csv
-from datetime import datetime
+from collections import Counter
+from datetime import date, datetime, timedelta
+from email.message import EmailMessage
+import getpass
+import hashlib
+import heapq
+import hmac
+import io
+import json
+import marshal
+import mmap
+import multiprocessing
+from multiprocessing import shared_memory
 import os
+import pickle
+import smtplib
+import struct
+import threading
+import time
+import uuid
+from xml.sax.saxutils import escape as xml_escape
+import zipfile
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+BOOK_HEADERS = ['id', 'title', 'author', 'isbn', 'published_year', 'status']
+MEMBER_HEADERS = ['id', 'name', 'email', 'phone']
+BORROWING_HEADERS = ['id', 'book_id', 'member_id', 'borrow_date', 'return_date']
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_TABLES = (('books', BOOK_HEADERS), ('members', MEMBER_HEADERS), ('borrowings', BORROWING_HEADERS))
+TREE_FILL_CHUNK = 500   # Treeview rows inserted per event-loop turn
+ID_BLOCK_SIZE = 32
+PARALLEL_LOAD_MIN_BYTES = 16 * 1024 * 1024   # smaller files are parsed in-process
+PARALLEL_CHUNK_BYTES = 4 * 1024 * 1024
+
+USER_HEADERS = ['username', 'role', 'salt', 'password_hash', 'n', 'r', 'p']
+ROLES = ('admin', 'staff')
+SCRYPT_PARAMS = {'n': 2 ** 14, 'r': 8, 'p': 1}   # ~16 MB and tens of ms per hash
+SESSION_TTL_SECONDS = 12 * 3600
+
+LOAN_PERIOD_DAYS = 14
+REMINDER_DAYS_BEFORE_DUE = 2
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_RATE_PER_SECOND = 10.0
+OUTBOX_MAX_ATTEMPTS = 6
+OUTBOX_BACKOFF_SECONDS = 60          # doubled after every failed attempt
+OUTBOX_DEDUP_RETENTION_DAYS = 90     # delivered keys kept this long to suppress repeats
+REPORT_FORMATS = ('xlsx', 'pdf')
+INTEGRITY_MAX_PENDING = 100000
+INTEGRITY_NOTE_KINDS = ('deleted_reference',)   # reported, but not counted as issues
+RECOMMENDATION_NEIGHBORS = 20
+RECOMMENDATION_MAX_HISTORY = 200   # most recent distinct books per member used for co-occurrence
+
+AUDIT_FRAME = struct.Struct('<IId')  # payload length, CRC32 of payload, timestamp
+AUDIT_CHECKPOINT_INTERVAL = 5000
+
+
+class FileLock:
+    """Exclusive inter-process lock held on a small side file."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.filename, mode='a+b')
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        else:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+            else:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self.file.close()
+            self.file = None
+
+
+class SequenceAllocator:
+    """Hands out ids from blocks leased out of a persisted sequence file.
+
+    Every lease advances the stored value under a file lock, so ids stay unique
+    across processes and never go backwards after deletions or restarts. Ids
+    left over in a lease when the process exits are simply skipped.
+    """
+
+    def __init__(self, filename="sequences.csv", block_size=ID_BLOCK_SIZE):
+        self.filename = filename
+        self.block_size = block_size
+        self.leases = {}
+        self._lock = threading.Lock()
+
+    def next_id(self, name, seed=None):
+        """Returns the next id for a sequence. seed() gives its first value if it was never stored."""
+        with self._lock:
+            lease = self.leases.get(name)
+            if lease is None or lease[0] >= lease[1]:
+                lease = self._lease_block(name, seed)
+                self.leases[name] = lease
+            value = lease[0]
+            lease[0] += 1
+            return value
+
+    def _lease_block(self, name, seed):
+        """Reserves the next block of ids for a sequence in the sequence file."""
+        with FileLock(self.filename + ".lock"):
+            values = self._read()
+            start = values.get(name)
+            if start is None:
+                start = seed() if seed is not None else 1
+            values[name] = start + self.block_size
+            self._write(values)
+        return [start, start + self.block_size]
+
+    def _read(self):
+        values = {}
+        if os.path.exists(self.filename):
+            with open(self.filename, mode='r', newline='', encoding='utf-8') as file:
+                for row in csv.DictReader(file):
+                    try:
+                        values[row['name']] = int(row['next_value'])
+                    except (KeyError, TypeError, ValueError):
+                        continue
+        return values
+
+    def _write(self, values):
+        tmp_file = self.filename + ".tmp"
+        with open(tmp_file, mode='w', newline='', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames=['name', 'next_value'])
+            writer.writeheader()
+            for name, next_value in sorted(values.items()):
+                writer.writerow({'name': name, 'next_value': next_value})
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_file, self.filename)
+
+
+class AuditLog:
+    """Append-only binary log of every change to books, members and loans.
+
+    Each frame is a fixed header (payload length, CRC32, timestamp) followed by
+    a compact JSON payload with the actor, entity, action and the row before and
+    after the change. Full-state checkpoints are appended to a second file
+    together with the log offset they cover, so the state at any moment is
+    rebuilt from the closest earlier checkpoint rather than from the start.
+
+    A checkpoint is a byte copy of the CSV files (sources, {entity: filename})
+    taken right after the store saves them, so building one never walks the
+    in-memory tables; the rows are only parsed when a checkpoint is replayed.
+    """
+
+    def __init__(self, log_file="audit.log", checkpoint_file="audit.checkpoints",
+                 sources=None, checkpoint_interval=AUDIT_CHECKPOINT_INTERVAL):
+        self.log_file = log_file
+        self.checkpoint_file = checkpoint_file
+        self.sources = sources or {}
+        self.checkpoint_interval = checkpoint_interval
+        self.events_since_checkpoint = 0
+        self._unsaved = False
+        self._sources_read = threading.Event()
+        self._sources_read.set()
+        self._file = None
+        self._checkpoint_lock = threading.Lock()
+        self._checkpoint_threads = []
+
+    def has_history(self):
+        """True if a log or checkpoint has been written before."""
+        return any(os.path.exists(f) and os.path.getsize(f) > 0
+                   for f in (self.log_file, self.checkpoint_file))
+
+    def append(self, actor, entity, action, record_id, before, after):
+        """Appends one change. The frame is flushed to the OS but not fsynced."""
+        timestamp = time.time()
+        payload = json.dumps({
+            'actor': actor, 'entity': entity, 'action': action, 'id': record_id,
+            'before': before, 'after': after,
+        }, separators=(',', ':'), default=str).encode('utf-8')
+        if self._file is None:
+            self._file = open(self.log_file, mode='ab')
+        self._file.write(AUDIT_FRAME.pack(len(payload), zlib.crc32(payload), timestamp) + payload)
+        self._file.flush()
+        self.events_since_checkpoint += 1
+        self._unsaved = True
+
+    def sources_saved(self):
+        """Called once the source CSVs hold every logged change; checkpoints if one is due."""
+        self._unsaved = False
+        if self.events_since_checkpoint >= self.checkpoint_interval:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Records the source files, as they are now, as the state at the end of the log.
+
+        The files are opened here, so a later save (which replaces them) cannot
+        change what is recorded; reading and writing happen on a background thread.
+        """
+        self._sources_read.wait()
+        handles = {}
+        for entity, filename in self.sources.items():
+            try:
+                handles[entity] = open(filename, mode='rb')
+            except OSError:
+                handles[entity] = None
+        if self._file is not None:
+            self._file.flush()
+        offset = os.path.getsize(self.log_file) if os.path.exists(self.log_file) else 0
+        timestamp = time.time()
+        self.events_since_checkpoint = 0
+        self._sources_read.clear()
+        thread = threading.Thread(target=self._write_checkpoint, args=(timestamp, offset, handles))
+        self._checkpoint_threads = [t for t in self._checkpoint_threads if t.is_alive()] + [thread]
+        thread.start()
+
+    def _write_checkpoint(self, timestamp, offset, handles):
+        sources = {}
+        try:
+            for entity, handle in handles.items():
+                if handle is None:
+                    sources[entity] = b""
+                    continue
+                with handle:
+                    sources[entity] = handle.read()
+        finally:
+            self._sources_read.set()
+        payload = pickle.dumps({'offset': offset, 'sources': sources}, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._checkpoint_lock:
+            with open(self.checkpoint_file, mode='ab') as file:
+                file.write(AUDIT_FRAME.pack(len(payload), zlib.crc32(payload), timestamp))
+                file.write(payload)
+
+    def release_sources(self):
+        """Waits until a running checkpoint has read the source files, so they can be replaced."""
+        self._sources_read.wait()
+
+    def _checkpoint_state(self, checkpoint):
+        state = {}
+        for entity, data in checkpoint['sources'].items():
+            reader = csv.DictReader(io.StringIO(data.decode('utf-8'), newline=''))
+            state[entity] = {int(row['id']): row for row in map(_normalize_row, reader)}
+        return state
+
+    def close(self):
+        """Checkpoints any saved events since the last checkpoint and closes the log."""
+        if self.events_since_checkpoint and not self._unsaved:
+            self.checkpoint()
+        for thread in self._checkpoint_threads:
+            thread.join()
+        self._checkpoint_threads = []
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _frames(self, filename, offset=0, read_payload=True):
+        """Yields (offset, timestamp, payload) for each intact frame, stopping at a torn tail."""
+        if not os.path.exists(filename):
+            return
+        with open(filename, mode='rb') as file:
+            file.seek(offset)
+            while True:
+                header = file.read(AUDIT_FRAME.size)
+                if len(header) < AUDIT_FRAME.size:
+                    return
+                length, crc, timestamp = AUDIT_FRAME.unpack(header)
+                if not read_payload:
+                    yield offset, timestamp, None
+                    file.seek(length, os.SEEK_CUR)
+                else:
+                    payload = file.read(length)
+                    if len(payload) < length or zlib.crc32(payload) != crc:
+                        return
+                    yield offset, timestamp, payload
+                offset += AUDIT_FRAME.size + length
+
+    def _as_timestamp(self, when):
+        return when.timestamp() if isinstance(when, datetime) else float(when)
+
+    def events(self, since=None, until=None):
+        """Yields (timestamp, event) pairs, optionally limited to a time range."""
+        since = None if since is None else self._as_timestamp(since)
+        until = None if until is None else self._as_timestamp(until)
+        for _, timestamp, payload in self._frames(self.log_file):
+            if until is not None and timestamp > until:
+                return
+            if since is None or timestamp >= since:
+                yield timestamp, json.loads(payload)
+
+    def state_at(self, when):
+        """Rebuilds {entity: {id: row}} as it was at `when` (datetime or epoch seconds)."""
+        when = self._as_timestamp(when)
+        for thread in self._checkpoint_threads:
+            thread.join()
+
+        # Find the last checkpoint taken at or before `when` from the frame headers alone
+        checkpoint_offset = None
+        for offset, timestamp, _ in self._frames(self.checkpoint_file, read_payload=False):
+            if timestamp > when:
+                break
+            checkpoint_offset = offset
+
+        state = {}
+        log_offset = 0
+        if checkpoint_offset is not None:
+            for _, _, payload in self._frames(self.checkpoint_file, offset=checkpoint_offset):
+                checkpoint = pickle.loads(payload)
+                state = self._checkpoint_state(checkpoint)
+                log_offset = checkpoint['offset']
+                break
+
+        for _, timestamp, payload in self._frames(self.log_file, offset=log_offset):
+            if timestamp > when:
+                break
+            event = json.loads(payload)
+            rows = state.setdefault(event['entity'], {})
+            if event['after'] is None:
+                rows.pop(event['id'], None)
+            else:
+                rows[event['id']] = event['after']
+        return state
+
+    def record_at(self, entity, record_id, when):
+        """Returns a single book, member or loan row as it was at `when`, or None."""
+        return self.state_at(when).get(entity, {}).get(int(record_id))
+
+    def history(self, entity, record_id):
+        """Returns every logged change to one record, oldest first."""
+        record_id = int(record_id)
+        return [(timestamp, event) for timestamp, event in self.events()
+                if event['entity'] == entity and event['id'] == record_id]
+
+
+class BulkDeleteReport:
+    """Outcome of a bulk delete: what was (or, for a dry run, would be) removed and what was blocked."""
+
+    def __init__(self, table, dry_run):
+        self.table = table
+        self.dry_run = dry_run
+        self.deleted = []
+        self.blocked = {}   # id -> reason
+        self.missing = []
+        self.history_loans = 0   # returned loans of the deleted rows, kept as history
+        # Purges only: members with no loan history, and whether they were included
+        self.never_borrowed = []
+        self.never_borrowed_included = False
+
+    def summary(self):
+        verb = "Would delete" if self.dry_run else "Deleted"
+        lines = [f"{verb} {len(self.deleted)} {self.table}."]
+        for record_id, reason in sorted(self.blocked.items()):
+            lines.append(f"Blocked ID {record_id}: {reason}")
+        if self.missing:
+            lines.append("Not found: " + ", ".join(str(i) for i in sorted(self.missing)))
+        if self.history_loans:
+            lines.append(f"{self.history_loans} returned loan(s) of these {self.table} are kept as history.")
+        if self.never_borrowed:
+            label = "Never borrowed (included)" if self.never_borrowed_included else "Never borrowed (kept)"
+            lines.append(f"{label}: " + ", ".join(str(i) for i in sorted(self.never_borrowed)))
+        return "\n".join(lines)
+
+
+# CSV Loading
+def _normalize_row(row):
+    """Casts the id, year and return date fields of a CSV row in place."""
+    if 'id' in row and row['id'] != '':
+        row['id'] = int(row['id'])
+    if 'book_id' in row and row['book_id'] != '':
+        row['book_id'] = int(row['book_id'])
+    if 'member_id' in row and row['member_id'] != '':
+        row['member_id'] = int(row['member_id'])
+    if 'published_year' in row and row['published_year']:
+        try:
+            row['published_year'] = int(row['published_year'])
+        except ValueError:
+            row['published_year'] = None
+    if 'return_date' in row and (row['return_date'] == 'None' or row['return_date'] == ''):
+        row['return_date'] = None
+    return row
+
+
+def _csv_chunks(filename, chunk_bytes=PARALLEL_CHUNK_BYTES):
+    """Returns (headers, [(start, end), ...]) splitting the records of a CSV file into byte ranges.
+
+    Every range starts right after a newline that is outside quotes (an even
+    number of '"' before it), so a quoted field never spans two ranges.
+    """
+    with open(filename, mode='rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        header_line = file.readline()
+        headers = next(csv.reader([header_line.decode('utf-8')]))
+        if size == len(header_line):
+            return headers, []
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            ranges = []
+            start = len(header_line)
+            quotes_odd = False
+            while start < size:
+                end = min(start + chunk_bytes, size)
+                scanned = start
+                while end < size:
+                    newline = mm.find(b'\n', end)
+                    end = size if newline < 0 else newline + 1
+                    quotes_odd ^= mm[scanned:end].count(b'"') % 2 == 1
+                    scanned = end
+                    if not quotes_odd:
+                        break
+                ranges.append((start, end))
+                start = end
+    return headers, ranges
+
+
+def _parse_csv_chunk(filename, start, end, headers):
+    """Worker: parses one byte range and returns its columns through a shared memory block.
+
+    Returns (block name, payload size). The block holds the marshalled column
+    tuples; the caller copies them out and unlinks the block.
+    """
+    with open(filename, mode='rb') as file:
+        file.seek(start)
+        text = file.read(end - start).decode('utf-8')
+    columns = [[] for _ in headers]
+    for fields in csv.reader(io.StringIO(text, newline='')):
+        if not fields:
+            continue
+        if len(fields) != len(headers):
+            raise ValueError(f"{filename}: record with {len(fields)} fields, expected {len(headers)}")
+        row = _normalize_row(dict(zip(headers, fields)))
+        for column, h in zip(columns, headers):
+            column.append(row[h])
+    payload = marshal.dumps([tuple(column) for column in columns])
+    block = shared_memory.SharedMemory(create=True, size=max(1, len(payload)))
+    block.buf[:len(payload)] = payload
+    name = block.name
+    block.close()
+    return name, len(payload)
+
+
+def _read_shared_columns(name, size):
+    """Copies marshalled columns out of a worker's shared memory block and frees it."""
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        view = block.buf[:size]
+        columns = marshal.loads(view)
+        view.release()
+    finally:
+        block.close()
+        block.unlink()
+    return columns
+
+
+def load_csv_parallel(filenames, workers=None):
+    """Loads several CSV files with a process pool, splitting each into record-aligned chunks.
+
+    Returns one list of row dicts per file, in the same form as the serial loader.
+    """
+    workers = workers or os.cpu_count() or 1
+    plans = []
+    for filename in filenames:
+        if os.path.exists(filename):
+            plans.append(_csv_chunks(filename))
+        else:
+            plans.append(([], []))
+
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        futures = [[executor.submit(_parse_csv_chunk, filename, start, end, headers) for start, end in ranges]
+                   for filename, (headers, ranges) in zip(filenames, plans)]
+        tables = []
+        errors = []
+        for (headers, _), file_futures in zip(plans, futures):
+            rows = []
+            for future in file_futures:
+                try:
+                    name, size = future.result()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                columns = _read_shared_columns(name, size)
+                rows.extend(dict(zip(headers, values)) for values in zip(*columns))
+            tables.append(rows)
+    if errors:
+        raise errors[0]
+    return tables
+
+
+def _csv_file_stats(filenames):
+    """Returns (mtime_ns, size) per file, or None for missing files."""
+    stats = []
+    for filename in filenames:
+        try:
+            st = os.stat(filename)
+            stats.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            stats.append(None)
+    return tuple(stats)
+
+
+def _read_csv(filename):
+    """Parses one CSV file into normalized row dicts; a missing file has no rows."""
+    data = []
+    if os.path.exists(filename):
+        with open(filename, mode='r', newline='', encoding='utf-8') as file:
+            reader = csv.DictReader(file)
+            for row in reader:
+                # Normalize and cast fields
+                data.append(_normalize_row(row))
+    return data
+
+
+def _read_snapshot(snapshot_file, stats):
+    """Returns [books, members, borrowings] from the snapshot if it was taken from CSVs with these stats."""
+    try:
+        with open(snapshot_file, mode='rb') as file:
+            image = pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+        return None
+    if not isinstance(image, dict) or image.get('version') != SNAPSHOT_VERSION or image.get('stats') != stats:
+        return None
+    tables = []
+    for name, headers in SNAPSHOT_TABLES:
+        columns = image['tables'][name]
+        tables.append([dict(zip(headers, values)) for values in zip(*(columns[h] for h in headers))])
+    return tables
+
+
+class LibraryTables:
+    """Read-only copy of books, members and borrowings for code that only reads rows.
+
+    Used by worker processes: it loads the snapshot when it matches the CSVs and
+    otherwise parses them serially, without the id sequences, audit log,
+    listeners or loader pool that a LibraryStore sets up.
+    """
+
+    def __init__(self, books_file="books.csv", members_file="members.csv",
+                 borrowings_file="borrowings.csv", snapshot_file="library.snapshot"):
+        filenames = (books_file, members_file, borrowings_file)
+        tables = _read_snapshot(snapshot_file, _csv_file_stats(filenames))
+        if tables is None:
+            tables = [_read_csv(filename) for filename in filenames]
+        self.books, self.members, self.borrowings = tables
+
+
+# Data Store
+class LibraryStore:
+    """Owns the in-memory tables and keeps them in sync with the CSV files.
+
+    A store is opened once per process and shared by every login session, and
+    on clean shutdown it writes a pickled columnar snapshot next to the CSVs so
+    the next start can skip parsing them.
+    """
+
+    _open_stores = {}
+
+    def __init__(self, books_file="books.csv", members_file="members.csv",
+                 borrowings_file="borrowings.csv", snapshot_file="library.snapshot",
+                 sequences_file="sequences.csv", audit_file="audit.log"):
+        self.books_file = books_file
+        self.members_file = members_file
+        self.borrowings_file = borrowings_file
+        self.snapshot_file = snapshot_file
+        self.ids = SequenceAllocator(sequences_file)
+        self.audit = AuditLog(audit_file, audit_file + ".checkpoints",
+                              sources={'book': books_file, 'member': members_file, 'loan': borrowings_file})
+
+        # Recorded as the actor of every change; set by whoever is logged in
+        self.actor = "system"
+        # Called as listener(entity, action, record_id, before, after) after each change
+        self.listeners = []
+        self.integrity = IntegrityChecker(self)
+        # Created by whoever first needs suggestions; see recommendations()
+        self.recommender = None
+        # Created by the desk UI; see enable_notifications()
+        self.outbox = None
+
+        self.books = []
+        self.members = []
+        self.borrowings = []
+
+        self._file_stats = None
+        self._snapshot_stats = None
+
+        self.load()
+
+    @classmethod
+    def open(cls, books_file="books.csv", members_file="members.csv",
+             borrowings_file="borrowings.csv", snapshot_file="library.snapshot",
+             sequences_file="sequences.csv", audit_file="audit.log"):
+        """Returns the already loaded store for these files, loading it if needed."""
+        key = tuple(os.path.abspath(f) for f in (books_file, members_file, borrowings_file))
+        store = cls._open_stores.get(key)
+        if store is None or store._current_file_stats() != store._file_stats:
+            if store is not None:
+                store.audit.close()
+            store = cls(books_file, members_file, borrowings_file, snapshot_file, sequences_file, audit_file)
+            cls._open_stores[key] = store
+        return store
+
+    @classmethod
+    def shutdown(cls):
+        """Writes a snapshot and closes the audit log of every open store. Call once the UI has exited."""
+        for store in cls._open_stores.values():
+            store.write_snapshot()
+            store.audit.close()
+
+    def _current_file_stats(self):
+        """Returns (mtime_ns, size) per CSV file, or None for missing files."""
+        return _csv_file_stats((self.books_file, self.members_file, self.borrowings_file))
+
+    def load(self):
+        """Loads the tables from the snapshot if it is current, else from the CSV files."""
+        stats = self._current_file_stats()
+        if not self._load_snapshot(stats):
+            self.books, self.members, self.borrowings = self._load_tables(stats)
+        self._file_stats = stats
+        if not self.audit.has_history():
+            # Baseline so the first logged changes can be replayed on top of it
+            self.audit.checkpoint()
+
+    def save(self):
+        """Saves the tables to their CSV files."""
+        self.audit.release_sources()
+        self._save_csv(self.books_file, self.books, BOOK_HEADERS)
+        self._save_csv(self.members_file, self.members, MEMBER_HEADERS)
+        self._save_csv(self.borrowings_file, self.borrowings, BORROWING_HEADERS)
+        self._file_stats = self._current_file_stats()
+        self.audit.sources_saved()
+
+    def record_change(self, entity, action, record_id, before, after):
+        """Logs a change to a 'book', 'member' or 'loan' and notifies listeners.
+
+        before/after are the full rows (None when the row did not/no longer exists).
+        """
+        self.audit.append(self.actor, entity, action, int(record_id), before, after)
+        for listener in self.listeners:
+            listener(entity, action, int(record_id), before, after)
+
+    def next_id(self, table):
+        """Allocates a new id for 'books', 'members' or 'borrowings'."""
+        rows = {'books': self.books, 'members': self.members, 'borrowings': self.borrowings}[table]
+        # The table is only scanned once, the first time its sequence is created
+        return self.ids.next_id(table, seed=lambda: self._max_id(rows) + 1)
+
+    def _max_id(self, rows):
+        return max((int(row['id']) for row in rows if row.get('id') not in (None, '')), default=0)
+
+    def open_loan_index(self):
+        """Returns the sets of book ids and member ids that currently have an open loan."""
+        book_ids = set()
+        member_ids = set()
+        for b in self.borrowings:
+            if b['return_date'] is None:
+                book_ids.add(int(b['book_id']))
+                member_ids.add(int(b['member_id']))
+        return book_ids, member_ids
+
+    def delete_books(self, book_ids, dry_run=False):
+        """Deletes the given books in one pass and saves once. Books on loan are blocked."""
+        open_books, _ = self.open_loan_index()
+        report = self._plan_delete('books', self.books, book_ids, open_books,
+                                   "currently borrowed", dry_run, 'book_id')
+        if not dry_run and report.deleted:
+            doomed = set(report.deleted)
+            self.books = self._remove_rows('book', self.books, doomed)
+            self.save()
+        return report
+
+    def delete_members(self, member_ids, dry_run=False):
+        """Deletes the given members in one pass and saves once. Members with open loans are blocked."""
+        _, open_members = self.open_loan_index()
+        report = self._plan_delete('members', self.members, member_ids, open_members,
+                                   "has outstanding borrowed books", dry_run, 'member_id')
+        if not dry_run and report.deleted:
+            doomed = set(report.deleted)
+            self.members = self._remove_rows('member', self.members, doomed)
+            self.save()
+        return report
+
+    def inactive_members(self, before_date, include_never_borrowed=False):
+        """Returns ids of members with no borrowing on or after before_date (YYYY-MM-DD).
+
+        Members who have never borrowed anything (e.g. registered today) are
+        left out unless include_never_borrowed is set. Raises ValueError if
+        before_date is not a YYYY-MM-DD date.
+        """
+        before_date = self._parse_cutoff(before_date)
+        active, borrowed = set(), set()
+        for b in self.borrowings:
+            borrowed.add(int(b['member_id']))
+            if b['return_date'] is None or str(b.get('borrow_date', '')) >= before_date:
+                active.add(int(b['member_id']))
+        return [int(m['id']) for m in self.members if int(m['id']) not in active
+                and (include_never_borrowed or int(m['id']) in borrowed)]
+
+    def _parse_cutoff(self, before_date):
+        """Returns before_date as a canonical YYYY-MM-DD string, which compares correctly with loan dates."""
+        try:
+            return datetime.strptime(str(before_date).strip(), "%Y-%m-%d").date().isoformat()
+        except ValueError:
+            raise ValueError(f"Invalid date '{before_date}'; expected YYYY-MM-DD.") from None
+
+    def never_borrowed_members(self):
+        """Returns ids of members without any loan history."""
+        borrowed = {int(b['member_id']) for b in self.borrowings}
+        return [int(m['id']) for m in self.members if int(m['id']) not in borrowed]
+
+    def purge_inactive_members(self, before_date, dry_run=False, include_never_borrowed=False):
+        """Deletes every member who has not borrowed anything since before_date.
+
+        The report lists members who never borrowed separately, whether or not they were included.
+        Raises ValueError if before_date is not a YYYY-MM-DD date.
+        """
+        before_date = self._parse_cutoff(before_date)
+        never_borrowed = self.never_borrowed_members()
+        report = self.delete_members(self.inactive_members(before_date, include_never_borrowed), dry_run=dry_run)
+        report.never_borrowed = never_borrowed
+        report.never_borrowed_included = include_never_borrowed
+        return report
+
+    def _remove_rows(self, entity, rows, doomed):
+        """Returns rows without the doomed ids, logging each removal."""
+        kept = []
+        for row in rows:
+            if int(row['id']) in doomed:
+                self.record_change(entity, 'delete', row['id'], dict(row), None)
+            else:
+                kept.append(row)
+        return kept
+
+    def _plan_delete(self, table, rows, ids, referenced, reason, dry_run, loan_field):
+        report = BulkDeleteReport(table, dry_run)
+        existing = {int(row['id']) for row in rows}
+        for record_id in dict.fromkeys(int(i) for i in ids):
+            if record_id not in existing:
+                report.missing.append(record_id)
+            elif record_id in referenced:
+                report.blocked[record_id] = reason
+            else:
+                report.deleted.append(record_id)
+        # Their returned loans stay; the integrity check lists them as deleted_reference notes
+        doomed = set(report.deleted)
+        report.history_loans = sum(1 for b in self.borrowings if int(b[loan_field]) in doomed)
+        return report
+
+    def recommendations(self):
+        """Returns the store's Recommender, starting its first build in the background."""
+        if self.recommender is None:
+            self.recommender = Recommender(self)
+            self.recommender.rebuild_async()
+        return self.recommender
+
+    def enable_notifications(self, outbox_file="outbox.log"):
+        """Starts queuing member notifications for new and returned loans."""
+        if self.outbox is None:
+            self.outbox = Outbox(outbox_file)
+            NotificationRules(self, self.outbox)
+        return self.outbox
+
+    def titles_for(self, book_ids):
+        """Titles for the given book ids, skipping books that no longer exist."""
+        titles = {int(b['id']): b.get('title', '') for b in self.books} if book_ids else {}
+        return [titles[i] for i in book_ids if i in titles]
+
+    def generation(self):
+        """Short tag that changes whenever any CSV file changes on disk."""
+        return hashlib.sha1(repr(self._current_file_stats()).encode('utf-8')).hexdigest()[:16]
+
+    def _tables(self):
+        return (
+            ('books', self.books, BOOK_HEADERS),
+            ('members', self.members, MEMBER_HEADERS),
+            ('borrowings', self.borrowings, BORROWING_HEADERS),
+        )
+
+    def write_snapshot(self):
+        """Writes the tables as a columnar pickle tagged with the CSV file stats."""
+        if self._snapshot_stats is not None and self._snapshot_stats == self._file_stats:
+            return
+        image = {'version': SNAPSHOT_VERSION, 'stats': self._file_stats, 'tables': {}}
+        for name, rows, headers in self._tables():
+            image['tables'][name] = {h: [row.get(h) for row in rows] for h in headers}
+        tmp_file = self.snapshot_file + ".tmp"
+        try:
+            with open(tmp_file, mode='wb') as file:
+                pickle.dump(image, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, self.snapshot_file)
+        except OSError:
+            return
+        self._snapshot_stats = self._file_stats
+
+    def _load_snapshot(self, stats):
+        """Loads the snapshot if it was taken from CSV files identical to the current ones."""
+        tables = _read_snapshot(self.snapshot_file, stats)
+        if tables is None:
+            return False
+        self.books, self.members, self.borrowings = tables
+        self._snapshot_stats = stats
+        return True
+
+    def _load_tables(self, stats):
+        """Parses the three CSV files, in parallel when any of them is large."""
+        filenames = (self.books_file, self.members_file, self.borrowings_file)
+        if any(st is not None and st[1] >= PARALLEL_LOAD_MIN_BYTES for st in stats):
+            try:
+                return load_csv_parallel(filenames)
+            except (OSError, ValueError, UnicodeDecodeError, RuntimeError):
+                pass  # Malformed chunk or no worker processes available; parse serially instead
+        return [self._load_csv(filename) for filename in filenames]
+
+    def _load_csv(self, filename):
+        """Helper to load data from a single CSV file."""
+        return _read_csv(filename)
+
+    def _save_csv(self, filename, data, headers):
+        """Helper to save data to a single CSV file with provided headers."""
+        # Written aside and swapped in, so readers (and audit checkpoints) never see a partial file
+        tmp_file = filename + ".tmp"
+        with open(tmp_file, mode='w', newline='', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames=headers)
+            writer.writeheader()
+            for item in data:
+                row = {}
+                for h in headers:
+                    v = item.get(h, "")
+                    if h == 'return_date' and v is None:
+                        v = None
+                    row[h] = v
+                writer.writerow(row)
+        os.replace(tmp_file, filename)
+
+
+# Authentication
+class UserStore:
+    """Staff accounts in users.csv with salted scrypt password hashes, plus signed session tokens.
+
+    The scrypt check is deliberately slow, so it runs once per password per
+    process: afterwards an HMAC of the credentials is remembered and a repeat
+    login (e.g. after logout) only costs that HMAC. Sessions are HMAC-signed
+    tokens that verify in microseconds and are cached once verified.
+
+    users.csv and the shared revocation list are re-read whenever they change
+    on disk, so an account reset, removal or role change made by another
+    process (or desk) takes effect immediately. Tokens carry a stamp of the
+    password hash, so resetting a password also ends existing sessions.
+    """
+
+    _open_stores = {}
+
+    def __init__(self, users_file="users.csv", key_file="session.key", revoked_file="session.revoked"):
+        self.users_file = users_file
+        self.key_file = key_file
+        self.revoked_file = revoked_file
+        self.users = {}
+        self.secret = self._load_secret()
+        self._verified_credentials = {}   # username -> HMAC of username/password known to be correct
+        self._sessions = {}               # token -> identity dict
+        self._revoked = set()             # SHA-256 of revoked tokens, shared through revoked_file
+        self._users_stat = None
+        self._revoked_stat = None
+        self._refresh()
+        if not self.users:
+            # Same default account the single-user login used to hard-code
+            self.add_user("admin", "admin123", role="admin")
+
+    @classmethod
+    def open(cls, users_file="users.csv", key_file="session.key", revoked_file="session.revoked"):
+        """Returns the process-wide store for these files."""
+        key = os.path.abspath(users_file)
+        store = cls._open_stores.get(key)
+        if store is None:
+            store = cls(users_file, key_file, revoked_file)
+            cls._open_stores[key] = store
+        return store
+
+    def _load_secret(self):
+        try:
+            with open(self.key_file, mode='rb') as file:
+                secret = file.read()
+            if len(secret) >= 32:
+                return secret
+        except OSError:
+            pass
+        secret = os.urandom(32)
+        fd = os.open(self.key_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, mode='wb') as file:
+            file.write(secret)
+        return secret
+
+    def _stat(self, filename):
+        try:
+            st = os.stat(filename)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def _refresh(self):
+        """Re-reads users.csv and the revocation list if another process changed them."""
+        stat = self._stat(self.users_file)
+        if stat != self._users_stat:
+            self._users_stat = stat
+            self._reload_users()
+        stat = self._stat(self.revoked_file)
+        if stat != self._revoked_stat:
+            self._revoked_stat = stat
+            self._reload_revoked()
+
+    def _reload_users(self):
+        users = {}
+        if os.path.exists(self.users_file):
+            with open(self.users_file, mode='r', newline='', encoding='utf-8') as file:
+                for row in csv.DictReader(file):
+                    users[row['username']] = row
+        for username in set(self.users) | set(users):
+            old, new = self.users.get(username), users.get(username)
+            if old is None or new is None or (old['password_hash'], old['role']) != (new['password_hash'], new['role']):
+                self._forget(username)
+        self.users = users
+
+    def _reload_revoked(self):
+        revoked = set()
+        now = time.time()
+        if os.path.exists(self.revoked_file):
+            with open(self.revoked_file, mode='r', encoding='ascii') as file:
+                for line in file:
+                    try:
+                        token_hash, expires = line.split()
+                        if int(expires) >= now:
+                            revoked.add(token_hash)
+                    except ValueError:
+                        continue
+        self._revoked = revoked
+        self._sessions = {t: ident for t, ident in self._sessions.items() if self._token_hash(t) not in revoked}
+
+    def _forget(self, username):
+        """Drops cached credentials and sessions for one user."""
+        self._verified_credentials.pop(username, None)
+        self._sessions = {t: ident for t, ident in self._sessions.items() if ident['username'] != username}
+
+    def _save(self):
+        tmp_file = self.users_file + ".tmp"
+        with open(tmp_file, mode='w', newline='', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames=USER_HEADERS)
+            writer.writeheader()
+            for username in sorted(self.users):
+                writer.writerow({h: self.users[username].get(h, "") for h in USER_HEADERS})
+        os.replace(tmp_file, self.users_file)
+        self._users_stat = self._stat(self.users_file)
+
+    def _hash_password(self, password, salt, n, r, p):
+        return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p, maxmem=128 * r * (n + p + 2))
+
+    def _credential_digest(self, username, password):
+        return hmac.new(self.secret, f"{username}\0{password}".encode('utf-8'), hashlib.sha256).digest()
+
+    def _token_hash(self, token):
+        return hashlib.sha256(token.encode('ascii', errors='replace')).hexdigest()
+
+    def add_user(self, username, password, role="staff"):
+        """Creates or replaces an account."""
+        if not username or not password:
+            raise ValueError("Username and password are required.")
+        if role not in ROLES:
+            raise ValueError(f"Role must be one of: {', '.join(ROLES)}.")
+        salt = os.urandom(16)
+        digest = self._hash_password(password, salt, **SCRYPT_PARAMS)
+        self._refresh()
+        self.users[username] = {
+            'username': username,
+            'role': role,
+            'salt': salt.hex(),
+            'password_hash': digest.hex(),
+            'n': SCRYPT_PARAMS['n'],
+            'r': SCRYPT_PARAMS['r'],
+            'p': SCRYPT_PARAMS['p'],
+        }
+        self._save()
+        # Any cached credentials or sessions for this user are now stale
+        self._forget(username)
+
+    def remove_user(self, username):
+        self._refresh()
+        if self.users.pop(username, None) is not None:
+            self._save()
+            self._forget(username)
+
+    def check_password(self, username, password):
+        """True if the password is correct.
+
+        Only the first correct check per process runs scrypt. Every failed check
+        runs it, also for unknown usernames (against a dummy salt), so response
+        times do not reveal which accounts exist.
+        """
+        self._refresh()
+        user = self.users.get(username)
+        digest = self._credential_digest(username, password)
+        cached = self._verified_credentials.get(username)
+        if cached is not None and hmac.compare_digest(cached, digest):
+            return True
+        if user is None:
+            self._hash_password(password, b"\0" * 16, **SCRYPT_PARAMS)
+            return False
+        expected = bytes.fromhex(user['password_hash'])
+        actual = self._hash_password(password, bytes.fromhex(user['salt']),
+                                     int(user['n']), int(user['r']), int(user['p']))
+        if not hmac.compare_digest(expected, actual):
+            return False
+        self._verified_credentials[username] = digest
+        return True
+
+    def authenticate(self, username, password):
+        """Returns a session token for valid credentials, or None."""
+        if not self.check_password(username, password):
+            return None
+        return self.issue_token(username)
+
+    def issue_token(self, username):
+        self._refresh()
+        user = self.users[username]
+        expires = int(time.time()) + SESSION_TTL_SECONDS
+        stamp = user['password_hash'][:16]
+        body = base64.urlsafe_b64encode(f"{username}|{user['role']}|{stamp}|{expires}".encode('utf-8'))
+        signature = base64.urlsafe_b64encode(hmac.new(self.secret, body, hashlib.sha256).digest())
+        token = (body + b"." + signature).decode('ascii')
+        self._sessions[token] = {'username': username, 'role': user['role'], 'expires': expires}
+        return token
+
+    def verify_token(self, token):
+        """Returns {'username', 'role', 'expires'} for a valid, unexpired token, else None."""
+        if not token:
+            return None
+        self._refresh()
+        identity = self._sessions.get(token)
+        if identity is None:
+            if self._token_hash(token) in self._revoked:
+                return None
+            try:
+                body, signature = token.encode('ascii').split(b".")
+                expected = base64.urlsafe_b64encode(hmac.new(self.secret, body, hashlib.sha256).digest())
+                if not hmac.compare_digest(expected, signature):
+                    return None
+                username, role, stamp, expires = base64.urlsafe_b64decode(body).decode('utf-8').rsplit("|", 3)
+                expires = int(expires)
+            except (ValueError, UnicodeError):
+                return None
+            user = self.users.get(username)
+            if user is None or user['role'] != role or user['password_hash'][:16] != stamp:
+                return None
+            identity = {'username': username, 'role': role, 'expires': expires}
+            self._sessions[token] = identity
+        if identity['expires'] < time.time():
+            self._sessions.pop(token, None)
+            return None
+        return identity
+
+    def has_role(self, token, role):
+        identity = self.verify_token(token)
+        return identity is not None and identity['role'] == role
+
+    def revoke(self, token):
+        """Ends a session, e.g. on logout, for every process sharing the revocation list."""
+        identity = self.verify_token(token)
+        self._sessions.pop(token, None)
+        token_hash = self._token_hash(token)
+        self._revoked.add(token_hash)
+        if identity is not None:
+            with FileLock(self.revoked_file + ".lock"):
+                with open(self.revoked_file, mode='a', encoding='ascii') as file:
+                    file.write(f"{token_hash} {identity['expires']}\n")
+
+
+# Data Integrity
+class IntegrityReport:
+    """Issues found by an integrity check, and what a repair run changed."""
+
+    def __init__(self, issues, repairs=None, full=True, notes=None):
+        self.issues = issues      # list of (kind, subject, detail)
+        self.repairs = repairs or []
+        self.full = full
+        # Same shape as issues, but informational: they do not make a check fail
+        self.notes = notes or []
+
+    def summary(self):
+        lines = [f"{len(self.issues)} issue(s) found ({'full' if self.full else 'incremental'} check)."]
+        for kind, subject, detail in self.issues:
+            lines.append(f"{kind} [{subject}]: {detail}")
+        if self.notes:
+            lines.append(f"{len(self.notes)} returned loan(s) refer to deleted books or members (kept as history).")
+        if self.repairs:
+            lines.append(f"{len(self.repairs)} repair(s) applied:")
+            lines.extend("  " + repair for repair in self.repairs)
+        return "\n".join(lines)
+
+
+class IntegrityChecker:
+    """Finds contradictions between books, members and borrowings.
+
+    The first run is one pass over each table that builds hash indexes (ids,
+    ISBNs, emails, loans per book/member) and evaluates every check. The
+    checker then follows the store's change events, so later runs only update
+    the indexes for changed rows and re-evaluate the checks those rows touch.
+
+    Checks: loans pointing at missing books or members, a book whose status
+    disagrees with its open loans, a book with more than one open loan, and
+    duplicate ISBNs or member emails.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.issues = None        # (kind, subject) -> detail; None until the first full run
+        self.pending = []
+        store.listeners.append(self._on_change)
+
+    def _on_change(self, entity, action, record_id, before, after):
+        if self.issues is None:
+            return
+        if len(self.pending) >= INTEGRITY_MAX_PENDING:
+            self.issues = None    # Cheaper to start over than to replay this many changes
+            self.pending = []
+            return
+        self.pending.append((entity, record_id, before, after))
+
+    def _isbn(self, book):
+        return str(book.get('isbn', '')).strip()
+
+    def _email(self, member):
+        return str(member.get('email', '')).strip().lower()
+
+    # Index maintenance
+    def _build_indexes(self):
+        self.books = {}
+        self.members = set()
+        self.isbns = {}
+        self.emails = {}
+        self.loans = {}
+        self.loans_by_book = {}
+        self.loans_by_member = {}
+        for book in self.store.books:
+            self._add_book(int(book['id']), book)
+        for member in self.store.members:
+            self._add_member(int(member['id']), member)
+        for loan in self.store.borrowings:
+            self._add_loan(int(loan['id']), loan)
+
+    def _add_book(self, book_id, book):
+        self.books[book_id] = str(book.get('status', 'available'))
+        self.isbns.setdefault(self._isbn(book), set()).add(book_id)
+
+    def _remove_book(self, book_id, book):
+        self.books.pop(book_id, None)
+        self.isbns.get(self._isbn(book), set()).discard(book_id)
+
+    def _add_member(self, member_id, member):
+        self.members.add(member_id)
+        self.emails.setdefault(self._email(member), set()).add(member_id)
+
+    def _remove_member(self, member_id, member):
+        self.members.discard(member_id)
+        self.emails.get(self._email(member), set()).discard(member_id)
+
+    def _add_loan(self, loan_id, loan):
+        book_id, member_id = int(loan['book_id']), int(loan['member_id'])
+        self.loans[loan_id] = (book_id, member_id, loan['return_date'] is None, loan.get('borrow_date', ''))
+        self.loans_by_book.setdefault(book_id, set()).add(loan_id)
+        self.loans_by_member.setdefault(member_id, set()).add(loan_id)
+
+    def _remove_loan(self, loan_id, loan):
+        self.loans.pop(loan_id, None)
+        self.loans_by_book.get(int(loan['book_id']), set()).discard(loan_id)
+        self.loans_by_member.get(int(loan['member_id']), set()).discard(loan_id)
+
+    def _apply_pending(self):
+        """Updates the indexes for queued changes and returns the subjects they affect."""
+        affected = set()
+        for entity, record_id, before, after in self.pending:
+            if entity == 'book':
+                for row in (before, after):
+                    if row is not None:
+                        affected.add(('isbn', self._isbn(row)))
+                affected.add(('book', record_id))
+                affected.update(('loan', loan_id) for loan_id in self.loans_by_book.get(record_id, ()))
+                if before is not None:
+                    self._remove_book(record_id, before)
+                if after is not None:
+                    self._add_book(record_id, after)
+            elif entity == 'member':
+                for row in (before, after):
+                    if row is not None:
+                        affected.add(('email', self._email(row)))
+                affected.update(('loan', loan_id) for loan_id in self.loans_by_member.get(record_id, ()))
+                if before is not None:
+                    self._remove_member(record_id, before)
+                if after is not None:
+                    self._add_member(record_id, after)
+            elif entity == 'loan':
+                affected.add(('loan', record_id))
+                for row in (before, after):
+                    if row is not None:
+                        affected.add(('book', int(row['book_id'])))
+                if before is not None:
+                    self._remove_loan(record_id, before)
+                if after is not None:
+                    self._add_loan(record_id, after)
+        self.pending = []
+        return affected
+
+    # Checks
+    def _evaluate(self, subject):
+        """Yields (kind, subject, detail) for every issue of one subject."""
+        kind, key = subject
+        if kind == 'loan':
+            loan = self.loans.get(key)
+            if loan is None:
+                return
+            book_id, member_id, is_open, _ = loan
+            # A returned loan of a deleted book or member is history, not a contradiction
+            kind, state = ('orphaned_loan', "open") if is_open else ('deleted_reference', "returned")
+            if book_id not in self.books:
+                yield kind, subject, f"{state} loan {key} references deleted book {book_id}"
+            if member_id not in self.members:
+                yield kind, subject, f"{state} loan {key} references deleted member {member_id}"
+        elif kind == 'book':
+            status = self.books.get(key)
+            if status is None:
+                return
+            open_loans = sorted(l for l in self.loans_by_book.get(key, ()) if self.loans[l][2])
+            if len(open_loans) > 1:
+                yield 'double_loan', subject, f"book {key} has {len(open_loans)} open loans: {open_loans}"
+            if open_loans and status != 'borrowed':
+                yield 'status_mismatch', subject, f"book {key} is '{status}' but has an open loan"
+            elif not open_loans and status == 'borrowed':
+                yield 'status_mismatch', subject, f"book {key} is 'borrowed' but has no open loan"
+        elif kind == 'isbn':
+            ids = self.isbns.get(key, ())
+            if len(ids) > 1:
+                yield 'duplicate_isbn', subject, f"ISBN '{key}' is shared by books {sorted(ids)}"
+        elif kind == 'email':
+            ids = self.emails.get(key, ())
+            if len(ids) > 1:
+                yield 'duplicate_email', subject, f"email '{key}' is shared by members {sorted(ids)}"
+
+    def check(self, full=False):
+        """Runs the checks (incrementally when possible) and returns an IntegrityReport."""
+        if full or self.issues is None:
+            self.pending = []
+            self._build_indexes()
+            subjects = ([('loan', i) for i in self.loans] + [('book', i) for i in self.books]
+                        + [('isbn', k) for k in self.isbns] + [('email', k) for k in self.emails])
+            self.issues = {}
+            full = True
+        else:
+            subjects = self._apply_pending()
+            for subject in subjects:
+                for kind in ('orphaned_loan', 'deleted_reference', 'double_loan', 'status_mismatch',
+                             'duplicate_isbn', 'duplicate_email'):
+                    self.issues.pop((kind, subject), None)
+        for subject in subjects:
+            for kind, subj, detail in self._evaluate(subject):
+                # One entry per kind and subject; a loan missing both ends keeps both details
+                key = (kind, subj)
+                self.issues[key] = self.issues[key] + "; " + detail if key in self.issues else detail
+        found = sorted(((kind, f"{subj[0]} {subj[1]}", detail) for (kind, subj), detail in self.issues.items()),
+                       key=lambda issue: (issue[0], issue[1]))
+        issues = [issue for issue in found if issue[0] not in INTEGRITY_NOTE_KINDS]
+        notes = [issue for issue in found if issue[0] in INTEGRITY_NOTE_KINDS]
+        return IntegrityReport(issues, full=full, notes=notes)
+
+    def repair(self, today=None):
+        """Fixes what can be fixed automatically, saves once and returns a report.
+
+        Extra open loans on a book are closed as of the newest loan's date, open
+        loans of missing books or members are closed today, and book statuses are
+        set from their open loans. Duplicate ISBNs/emails need a person and are
+        only reported; returned loans of deleted records are kept as history.
+        """
+        today = today or date.today().isoformat()
+        self.check()
+        repairs = []
+        loans = {int(b['id']): b for b in self.store.borrowings}
+        books = {int(b['id']): b for b in self.store.books}
+
+        def close_loan(loan_id, return_date, why):
+            loan = loans[loan_id]
+            before = dict(loan)
+            loan['return_date'] = return_date
+            self.store.record_change('loan', 'return', loan_id, before, dict(loan))
+            repairs.append(f"closed loan {loan_id} on {return_date} ({why})")
+
+        for (kind, subject) in list(self.issues):
+            if kind == 'double_loan':
+                book_id = subject[1]
+                open_loans = [l for l in self.loans_by_book.get(book_id, ()) if self.loans[l][2]]
+                newest = max(open_loans, key=lambda l: (self.loans[l][3], l))
+                for loan_id in open_loans:
+                    if loan_id != newest:
+                        close_loan(loan_id, loans[newest].get('borrow_date') or today, f"superseded by loan {newest}")
+            elif kind == 'orphaned_loan':
+                loan_id = subject[1]
+                if self.loans[loan_id][2]:
+                    close_loan(loan_id, today, "book or member no longer exists")
+
+        self.check()
+        for (kind, subject) in list(self.issues):
+            if kind == 'status_mismatch':
+                book = books[subject[1]]
+                has_open = any(self.loans[l][2] for l in self.loans_by_book.get(subject[1], ()))
+                before = dict(book)
+                book['status'] = 'borrowed' if has_open else 'available'
+                self.store.record_change('book', 'update', subject[1], before, dict(book))
+                repairs.append(f"set book {subject[1]} status to '{book['status']}'")
+
+        if repairs:
+            self.store.save()
+        report = self.check()
+        report.repairs = repairs
+        return report
+
+
+# Recommendations
+def _top_neighbors(row, n):
+    return heapq.nlargest(n, row.items(), key=lambda item: (item[1], -item[0]))
+
+
+def _count_co_occurrences(borrowings, neighbor_count):
+    """Returns (member_books, co, neighbors) counted from a whole loan history."""
+    histories = {}
+    for loan in borrowings:
+        history = histories.setdefault(int(loan['member_id']), {})
+        # Borrowing a book again makes it the most recent one
+        history.pop(int(loan['book_id']), None)
+        history[int(loan['book_id'])] = None
+    member_books = {m: list(books)[-RECOMMENDATION_MAX_HISTORY:] for m, books in histories.items()}
+
+    co = {}
+    for books in member_books.values():
+        if len(books) < 2:
+            continue
+        for book_id in books:
+            row = co.get(book_id)
+            if row is None:
+                row = co[book_id] = Counter()
+            row.update(books)    # counted in C; the self-pair is removed below
+    for book_id, row in co.items():
+        del row[book_id]
+
+    neighbors = {book_id: _top_neighbors(row, neighbor_count) for book_id, row in co.items()}
+    return member_books, co, neighbors
+
+
+def _build_recommendations(files, neighbor_count):
+    """Worker: counts co-occurrences from the saved tables."""
+    return _count_co_occurrences(LibraryTables(*files).borrowings, neighbor_count)
+
+
+class Recommender:
+    """"Members who borrowed this also borrowed" suggestions from loan history.
+
+    co[a][b] counts the members who borrowed both a and b, kept as a sparse
+    dict of Counters. The top neighbors of every book are precomputed, so a
+    lookup is a dict read. New loans update the counts and the affected
+    neighbor lists as they happen, including taking back the pairs of a book
+    that falls out of a member's most recent RECOMMENDATION_MAX_HISTORY, so
+    the incremental state always equals a rebuild. The first full count runs
+    in a worker process and then replays any loans recorded while it ran.
+    """
+
+    def __init__(self, store, neighbors=RECOMMENDATION_NEIGHBORS):
+        self.store = store
+        self.neighbor_count = neighbors
+        self.member_books = {}    # member id -> list of distinct book ids, least recently borrowed first
+        self.co = {}
+        self.neighbors = {}       # book id -> [(book id, count), ...] best first
+        self.ready = False
+        self._lock = threading.Lock()
+        self._rebuilding = False
+        self._pending = []
+        store.listeners.append(self._on_change)
+
+    def _on_change(self, entity, action, record_id, before, after):
+        if entity != 'loan' or before is not None or after is None:
+            return
+        with self._lock:
+            if self._rebuilding:
+                self._pending.append((int(after['member_id']), int(after['book_id'])))
+            else:
+                self._add_loan(int(after['member_id']), int(after['book_id']))
+
+    def rebuild_async(self):
+        """Starts a full rebuild in a worker process; lookups use the old lists until it finishes.
+
+        The worker reads the saved CSVs (or snapshot), so counting never competes
+        with the UI for the GIL. Loans recorded meanwhile are replayed on top;
+        replaying one the worker already saw changes no counts.
+        """
+        with self._lock:
+            self._rebuilding = True
+            self._pending = []
+        store = self.store
+        files = (store.books_file, store.members_file, store.borrowings_file, store.snapshot_file)
+        try:
+            # Spawned, not forked, so the worker never inherits the Tk connection
+            executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+            future = executor.submit(_build_recommendations, files, self.neighbor_count)
+        except (OSError, RuntimeError):
+            with self._lock:
+                self._rebuilding = False
+            thread = threading.Thread(target=self.rebuild, daemon=True)
+            thread.start()
+            return None
+        future.add_done_callback(lambda done: self._install(done, executor))
+        return future
+
+    def _install(self, future, executor):
+        executor.shutdown(wait=False)
+        try:
+            counts = future.result()
+        except Exception:
+            counts = None    # Worker failed; count in-process instead
+        if counts is None:
+            with self._lock:
+                self._rebuilding = False
+            self.rebuild()
+            return
+        self._swap_in(*counts)
+
+    def rebuild(self):
+        """Recounts co-occurrences from the whole loan history, in this process."""
+        with self._lock:
+            self._rebuilding = True
+            self._pending = []
+        try:
+            counts = _count_co_occurrences(list(self.store.borrowings), self.neighbor_count)
+        except Exception:
+            with self._lock:
+                self._rebuilding = False
+            raise
+        self._swap_in(*counts)
+
+    def _swap_in(self, member_books, co, neighbors):
+        with self._lock:
+            self.member_books, self.co, self.neighbors = member_books, co, neighbors
+            for member_id, book_id in self._pending:
+                self._add_loan(member_id, book_id)
+            self._pending = []
+            self._rebuilding = False
+            self.ready = True
+
+    def _top(self, row):
+        return _top_neighbors(row, self.neighbor_count)
+
+    def _add_loan(self, member_id, book_id):
+        """Counts one new loan. Caller holds the lock."""
+        books = self.member_books.setdefault(member_id, [])
+        if book_id in books:
+            # Same set of books, so no counts change; it just becomes the most recent
+            books.remove(book_id)
+            books.append(book_id)
+            return
+        row = self.co.setdefault(book_id, Counter()) if books else None
+        for other in books:
+            row[other] += 1
+            other_row = self.co.setdefault(other, Counter())
+            other_row[book_id] += 1
+            # Only book_id's count changed in the other book's row, so its list needs at most one insert
+            current = [item for item in self.neighbors.get(other, []) if item[0] != book_id]
+            current.append((book_id, other_row[book_id]))
+            current.sort(key=lambda item: (item[1], -item[0]), reverse=True)
+            self.neighbors[other] = current[:self.neighbor_count]
+        if books:
+            self.neighbors[book_id] = self._top(row)
+        books.append(book_id)
+        if len(books) > RECOMMENDATION_MAX_HISTORY:
+            self._drop_oldest(books)
+
+    def _drop_oldest(self, books):
+        """Removes a member's least recent book and the pairs it formed with the rest."""
+        dropped = books.pop(0)
+        row = self.co[dropped]
+        for other in books:
+            for a, b in ((dropped, other), (other, dropped)):
+                counts = self.co[a]
+                counts[b] -= 1
+                if counts[b] <= 0:
+                    del counts[b]
+            other_row = self.co[other]
+            if not other_row:
+                del self.co[other]
+                self.neighbors.pop(other, None)
+            elif any(item[0] == dropped for item in self.neighbors.get(other, ())):
+                # A lower count may let another book into the list, so recompute it
+                self.neighbors[other] = self._top(other_row)
+        if row:
+            self.neighbors[dropped] = self._top(row)
+        else:
+            del self.co[dropped]
+            self.neighbors.pop(dropped, None)
+
+    def similar_books(self, book_id, n=5):
+        """Book ids most often borrowed by members who also borrowed book_id."""
+        return [other for other, _ in self.neighbors.get(int(book_id), [])[:n]]
+
+    def for_member(self, member_id, n=5):
+        """Book ids suggested for a member from the neighbor lists of their recent loans."""
+        history = self.member_books.get(int(member_id), [])
+        seen = set(history)
+        scores = Counter()
+        for book_id in history[-20:]:
+            for other, count in self.neighbors.get(book_id, ()):
+                if other not in seen:
+                    scores[other] += count
+        return [book_id for book_id, _ in heapq.nlargest(n, scores.items(), key=lambda item: (item[1], -item[0]))]
+
+
+# Notifications
+class Outbox:
+    """Durable queue of member notifications, journaled as JSON lines in outbox.log.
+
+    Every enqueue, delivery, retry and cancellation is one appended line, so
+    queuing from the desk is a single small locked write that never reads the
+    journal. Any number of processes can append. The dispatcher replays the
+    journal (refresh) and resolves dedup keys there: an enqueue whose key is
+    already pending or delivered is ignored, and a cancel by key drops the
+    pending message, so the same notification is never delivered twice.
+    """
+
+    def __init__(self, filename="outbox.log"):
+        self.filename = filename
+        self.pending = {}       # message id -> message
+        self.keys = {}          # dedup key -> message id (pending) or delivery time
+        self._offset = 0
+
+    def refresh(self):
+        """Applies journal lines written since the last refresh (by any process)."""
+        if not os.path.exists(self.filename):
+            return
+        if os.path.getsize(self.filename) < self._offset:
+            # Compacted by another process; start over
+            self.pending, self.keys, self._offset = {}, {}, 0
+        with open(self.filename, mode='rb') as file:
+            file.seek(self._offset)
+            for line in file:
+                if not line.endswith(b'\n'):
+                    break    # Partially written line; read it next time
+                self._offset += len(line)
+                self._apply(json.loads(line))
+
+    def _apply(self, entry):
+        op = entry['op']
+        if op == 'enqueue':
+            message = entry['message']
+            if message.get('dedup_key'):
+                if message['dedup_key'] in self.keys:
+                    return    # Already queued or delivered
+                self.keys[message['dedup_key']] = message['id']
+            self.pending[message['id']] = message
+        elif op == 'sent':
+            message = self.pending.pop(entry['id'], None)
+            if message is not None and message.get('dedup_key'):
+                self.keys[message['dedup_key']] = entry['at']
+        elif op == 'seen':
+            self.keys[entry['key']] = entry['at']
+        elif op == 'retry':
+            message = self.pending.get(entry['id'])
+            if message is not None:
+                message['attempts'] = entry['attempts']
+                message['next_attempt'] = entry['next_attempt']
+                message['last_error'] = entry['error']
+        elif op in ('cancel', 'dead'):
+            message_id = entry['id'] if 'id' in entry else self.keys.get(entry['key'])
+            if not isinstance(message_id, str):
+                return    # Unknown or already delivered
+            message = self.pending.pop(message_id, None)
+            if message is not None and message.get('dedup_key'):
+                self.keys.pop(message['dedup_key'], None)
+
+    def _write(self, entries):
+        with FileLock(self.filename + ".lock"):
+            with open(self.filename, mode='ab') as file:
+                file.write(b"".join((json.dumps(entry, separators=(',', ':')) + "\n").encode('utf-8')
+                                    for entry in entries))
+
+    def _append(self, *entries):
+        with FileLock(self.filename + ".lock"):
+            self.refresh()
+            with open(self.filename, mode='ab') as file:
+                for entry in entries:
+                    line = (json.dumps(entry, separators=(',', ':')) + "\n").encode('utf-8')
+                    file.write(line)
+                    self._offset += len(line)
+                    self._apply(entry)
+
+    def enqueue(self, kind, dedup_key=None, not_before=None, **fields):
+        """Queues a notification and returns its id. Duplicates by dedup key are dropped on replay."""
+        message = dict(fields, id=uuid.uuid4().hex, kind=kind, dedup_key=dedup_key,
+                       not_before=not_before or time.time(), attempts=0, next_attempt=0)
+        self._write([{'op': 'enqueue', 'message': message}])
+        return message['id']
+
+    def cancel(self, *dedup_keys):
+        """Drops pending notifications by dedup key, e.g. reminders for a returned loan."""
+        self._write([{'op': 'cancel', 'key': key} for key in dedup_keys])
+
+    def due(self, now=None, limit=OUTBOX_BATCH_SIZE):
+        """Pending messages whose send time and retry time have both passed, oldest first."""
+        now = now or time.time()
+        ready = (m for m in self.pending.values() if m['not_before'] <= now and m['next_attempt'] <= now)
+        return heapq.nsmallest(limit, ready, key=lambda m: m['not_before'])
+
+    def mark_results(self, sent_ids, failures, now=None):
+        """Records a batch outcome in one journal write. failures maps id -> error text."""
+        now = now or time.time()
+        entries = [{'op': 'sent', 'id': message_id, 'at': now} for message_id in sent_ids]
+        for message_id, error in failures.items():
+            message = self.pending.get(message_id)
+            if message is None:
+                continue
+            attempts = message['attempts'] + 1
+            if attempts >= OUTBOX_MAX_ATTEMPTS:
+                entries.append({'op': 'dead', 'id': message_id, 'error': error})
+            else:
+                entries.append({'op': 'retry', 'id': message_id, 'attempts': attempts, 'error': error,
+                                'next_attempt': now + OUTBOX_BACKOFF_SECONDS * 2 ** (attempts - 1)})
+        if entries:
+            self._append(*entries)
+
+    def compact(self):
+        """Rewrites the journal with only pending messages and recent delivery keys."""
+        with FileLock(self.filename + ".lock"):
+            self.refresh()
+            cutoff = time.time() - OUTBOX_DEDUP_RETENTION_DAYS * 86400
+            tmp_file = self.filename + ".tmp"
+            with open(tmp_file, mode='wb') as file:
+                for key, value in self.keys.items():
+                    if not isinstance(value, str) and value >= cutoff:
+                        file.write((json.dumps({'op': 'seen', 'key': key, 'at': value}) + "\n").encode('utf-8'))
+                for message in self.pending.values():
+                    file.write((json.dumps({'op': 'enqueue', 'message': message}) + "\n").encode('utf-8'))
+            os.replace(tmp_file, self.filename)
+            self.pending, self.keys, self._offset = {}, {}, 0
+            self.refresh()
+
+
+class NotificationRules:
+    """Turns loan events into queued notifications.
+
+    A new loan queues a receipt, a reminder a few days before the due date and
+    an overdue notice the day after it; returning the book cancels the last two.
+    Messages only carry ids and dates and are rendered at delivery time.
+    """
+
+    def __init__(self, store, outbox):
+        self.store = store
+        self.outbox = outbox
+        store.listeners.append(self._on_change)
+
+    def _on_change(self, entity, action, record_id, before, after):
+        if entity != 'loan':
+            return
+        if before is None and after is not None and after.get('return_date') is None:
+            borrowed = _parse_date(after.get('borrow_date', '')) or date.today()
+            due = borrowed + timedelta(days=LOAN_PERIOD_DAYS)
+            ids = {'loan_id': record_id, 'member_id': int(after['member_id']),
+                   'book_id': int(after['book_id']), 'due_date': due.isoformat()}
+            remind_at = datetime.combine(due - timedelta(days=REMINDER_DAYS_BEFORE_DUE), datetime.min.time())
+            overdue_at = datetime.combine(due + timedelta(days=1), datetime.min.time())
+            self.outbox.enqueue('receipt', dedup_key=f"receipt:{record_id}", **ids)
+            self.outbox.enqueue('due_reminder', dedup_key=f"due_reminder:{record_id}",
+                                not_before=remind_at.timestamp(), **ids)
+            self.outbox.enqueue('overdue', dedup_key=f"overdue:{record_id}",
+                                not_before=overdue_at.timestamp(), **ids)
+        elif after is None or after.get('return_date') is not None:
+            self.outbox.cancel(f"due_reminder:{record_id}", f"overdue:{record_id}")
+
+
+def render_notification(message, books, members, loans):
+    """Returns (to, subject, body) for a queued message, or None if it no longer applies.
+
+    Raises KeyError if its member, book or loan is unknown, e.g. not saved yet
+    when the indexes were built; the caller should reload and retry later.
+    """
+    member = members.get(message.get('member_id'))
+    book = books.get(message.get('book_id'))
+    loan = loans.get(message.get('loan_id'))
+    for name, row in (('member', member), ('book', book), ('loan', loan)):
+        if row is None:
+            raise KeyError(f"{name} {message.get(name + '_id')} not found")
+    if not str(member.get('email', '')).strip():
+        return None
+    if message['kind'] in ('due_reminder', 'overdue') and loan['return_date'] is not None:
+        return None
+    title = book.get('title', '')
+    greeting = f"Dear {member.get('name', 'member')},\n\n"
+    if message['kind'] == 'receipt':
+        subject = f"You borrowed '{title}'"
+        body = greeting + f"You borrowed '{title}'. Please return it by {message['due_date']}.\n"
+    elif message['kind'] == 'due_reminder':
+        subject = f"'{title}' is due on {message['due_date']}"
+        body = greeting + f"This is a reminder that '{title}' is due back on {message['due_date']}.\n"
+    else:
+        subject = f"'{title}' is overdue"
+        body = greeting + f"'{title}' was due back on {message['due_date']}. Please return it as soon as possible.\n"
+    return member['email'].strip(), subject, body
+
+
+class FileSinkTransport:
+    """Writes each email as an .eml file in a directory, for testing without a mail server."""
+
+    def __init__(self, directory="sent_mail", sender="library@localhost"):
+        self.directory = directory
+        self.sender = sender
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+
+    def send(self, message_id, to, subject, body):
+        email = EmailMessage()
+        email['From'] = self.sender
+        email['To'] = to
+        email['Subject'] = subject
+        email.set_content(body)
+        with open(os.path.join(self.directory, f"{message_id}.eml"), mode='wb') as file:
+            file.write(bytes(email))
+
+    def close(self):
+        pass
+
+
+class SmtpTransport:
+    """Sends email over SMTP, reusing one connection per batch."""
+
+    def __init__(self, host="localhost", port=25, sender="library@localhost",
+                 username=None, password=None, starttls=False):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.connection = None
+
+    def open(self):
+        self.connection = smtplib.SMTP(self.host, self.port, timeout=30)
+        if self.starttls:
+            self.connection.starttls()
+        if self.username:
+            self.connection.login(self.username, self.password)
+
+    def send(self, message_id, to, subject, body):
+        email = EmailMessage()
+        email['From'] = self.sender
+        email['To'] = to
+        email['Subject'] = subject
+        email['Message-ID'] = f"<{message_id}@{self.host}>"
+        email.set_content(body)
+        self.connection.send_message(email)
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.quit()
+            except smtplib.SMTPException:
+                pass
+            self.connection = None
+
+
+class OutboxDispatcher:
+    """Delivers due outbox messages in rate-limited batches through a transport.
+
+    Meant to run in its own process ('python app.py dispatch'), so delivery
+    never competes with the desk UI.
+    """
+
+    def __init__(self, outbox, transport, rate_per_second=OUTBOX_RATE_PER_SECOND,
+                 batch_size=OUTBOX_BATCH_SIZE, store_opener=None):
+        self.outbox = outbox
+        self.transport = transport
+        self.interval = 1.0 / rate_per_second if rate_per_second else 0.0
+        self.batch_size = batch_size
+        self.store_opener = store_opener or LibraryStore.open
+        self._store = None
+        self._indexes = None
+        self._store_checked = 0.0
+
+    def _lookups(self, force=False):
+        # Reopening reloads the CSVs if the desk changed them; at most once a minute unless forced
+        if not force and self._indexes is not None and time.monotonic() - self._store_checked < 60:
+            return self._indexes
+        self._store_checked = time.monotonic()
+        store = self.store_opener()
+        if store is not self._store:
+            self._store = store
+            self._indexes = ({int(b['id']): b for b in store.books},
+                             {int(m['id']): m for m in store.members},
+                             {int(b['id']): b for b in store.borrowings})
+        return self._indexes
+
+    def run_once(self, now=None):
+        """Sends one batch of due messages. Returns the number of messages handled."""
+        self.outbox.refresh()
+        batch = self.outbox.due(now, self.batch_size)
+        if not batch:
+            return 0
+        books, members, loans = self._lookups()
+        sent, failures = [], {}
+        try:
+            self.transport.open()
+        except (OSError, smtplib.SMTPException) as e:
+            self.outbox.mark_results([], {m['id']: f"connect: {e}" for m in batch}, now)
+            return len(batch)
+        try:
+            next_send = time.monotonic()
+            for message in batch:
+                try:
+                    rendered = render_notification(message, books, members, loans)
+                except KeyError:
+                    # Possibly newer than the indexes: reload once, else back off and retry
+                    books, members, loans = self._lookups(force=True)
+                    try:
+                        rendered = render_notification(message, books, members, loans)
+                    except KeyError as e:
+                        failures[message['id']] = str(e.args[0])
+                        continue
+                if rendered is None:
+                    sent.append(message['id'])    # No longer applies; nothing to deliver
+                    continue
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                next_send = max(next_send, time.monotonic()) + self.interval
+                try:
+                    self.transport.send(message['id'], *rendered)
+                    sent.append(message['id'])
+                except (OSError, smtplib.SMTPException) as e:
+                    failures[message['id']] = str(e)
+        finally:
+            self.transport.close()
+            self.outbox.mark_results(sent, failures, now)
+        return len(batch)
+
+    def run_forever(self, stop_event=None, idle_seconds=30):
+        """Keeps delivering until stop_event is set, sleeping while nothing is due."""
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            if not self.run_once():
+                stop_event.wait(idle_seconds)
+
+
+# Reports
+def _parse_date(value):
+    try:
+        return datetime.strptime(str(value), "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def _overdue_report(store, params):
+    """Open loans past their due date as of params['as_of']."""
+    as_of = _parse_date(params.get('as_of') or date.today().isoformat())
+    loan_days = int(params.get('loan_days', LOAN_PERIOD_DAYS))
+    books = {int(b['id']): b for b in store.books}
+    members = {int(m['id']): m for m in store.members}
+    yield ["Borrow ID", "Book Title", "ISBN", "Member Name", "Member Email", "Borrow Date", "Due Date", "Days Overdue"]
+    for b_rec in store.borrowings:
+        if b_rec['return_date'] is not None:
+            continue
+        borrowed = _parse_date(b_rec.get('borrow_date', ''))
+        if borrowed is None:
+            continue
+        due = borrowed + timedelta(days=loan_days)
+        if due >= as_of:
+            continue
+        book = books.get(int(b_rec['book_id']), {})
+        member = members.get(int(b_rec['member_id']), {})
+        yield [b_rec['id'], book.get('title', ''), book.get('isbn', ''), member.get('name', ''),
+               member.get('email', ''), b_rec['borrow_date'], due.isoformat(), (as_of - due).days]
+
+
+def _circulation_report(store, params):
+    """Loans and returns per day, month or year between params['start'] and params['end']."""
+    width = {'day': 10, 'month': 7, 'year': 4}[params.get('period', 'month')]
+    start = params.get('start') or ''
+    end = params.get('end') or '9999-12-31'
+    counts = {}
+    for b_rec in store.borrowings:
+        borrowed = str(b_rec.get('borrow_date') or '')
+        if start <= borrowed <= end:
+            counts.setdefault(borrowed[:width], [0, 0])[0] += 1
+        returned = str(b_rec.get('return_date') or '')
+        if returned and start <= returned <= end:
+            counts.setdefault(returned[:width], [0, 0])[1] += 1
+    yield ["Period", "Loans", "Returns"]
+    for period in sorted(counts):
+        yield [period, counts[period][0], counts[period][1]]
+
+
+def _inventory_report(store, params):
+    """Every book with its status and, when on loan, since when."""
+    on_loan_since = {int(b['book_id']): b.get('borrow_date', '') for b in store.borrowings if b['return_date'] is None}
+    yield ["ID", "Title", "Author", "ISBN", "Year", "Status", "On Loan Since"]
+    for book in store.books:
+        yield [book['id'], book.get('title', ''), book.get('author', ''), book.get('isbn', ''),
+               book.get('published_year', ''), str(book.get('status', 'available')).capitalize(),
+               on_loan_since.get(int(book['id']), '')]
+
+
+def _member_activity_report(store, params):
+    """Loan totals per member."""
+    activity = {}
+    for b_rec in store.borrowings:
+        stats = activity.setdefault(int(b_rec['member_id']), [0, 0, ''])
+        stats[0] += 1
+        if b_rec['return_date'] is None:
+            stats[1] += 1
+        stats[2] = max(stats[2], str(b_rec.get('borrow_date') or ''))
+    yield ["ID", "Name", "Email", "Total Loans", "Open Loans", "Last Borrowed"]
+    for member in store.members:
+        total, open_loans, last = activity.get(int(member['id']), (0, 0, ''))
+        yield [member['id'], member.get('name', ''), member.get('email', ''), total, open_loans, last]
+
+
+REPORT_TEMPLATES = {
+    'overdue': ("Overdue Loans", _overdue_report),
+    'circulation': ("Circulation by Period", _circulation_report),
+    'inventory': ("Inventory", _inventory_report),
+    'member_activity': ("Member Activity", _member_activity_report),
+}
+
+
+def _write_xlsx(filename, title, rows):
+    """Writes rows as a single-sheet XLSX workbook, streaming the sheet XML into the zip."""
+    with zipfile.ZipFile(filename, mode='w', compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml',
+                    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                    '<Default Extension="xml" ContentType="application/xml"/>'
+                    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+                    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                    '</Types>')
+        zf.writestr('_rels/.rels',
+                    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+                    '</Relationships>')
+        zf.writestr('xl/workbook.xml',
+                    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+                    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+                    f'<sheets><sheet name="{xml_escape(title[:31], {chr(34): "&quot;"})}" sheetId="1" r:id="rId1"/></sheets>'
+                    '</workbook>')
+        zf.writestr('xl/_rels/workbook.xml.rels',
+                    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+                    '</Relationships>')
+        with zf.open('xl/worksheets/sheet1.xml', mode='w', force_zip64=True) as sheet:
+            sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                        b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+            for row in rows:
+                cells = []
+                for value in row:
+                    if isinstance(value, (int, float)) and not isinstance(value, bool):
+                        cells.append(f'<c><v>{value}</v></c>')
+                    else:
+                        text = '' if value is None else xml_escape(str(value))
+                        cells.append(f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>')
+                sheet.write(('<row>' + ''.join(cells) + '</row>').encode('utf-8'))
+            sheet.write(b'</sheetData></worksheet>')
+
+
+def _write_pdf(filename, title, rows, column_width=22, font_size=7, lines_per_page=60):
+    """Writes rows as a landscape A4 table in Courier, emitting each page as soon as it is full."""
+    def pdf_text(text):
+        text = str(text).encode('latin-1', errors='replace').decode('latin-1')
+        return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+    with open(filename, mode='wb') as file:
+        offsets = {}
+        page_ids = []
+
+        def write_object(obj_id, body):
+            offsets[obj_id] = file.tell()
+            file.write(f"{obj_id} 0 obj\n".encode('latin-1') + body + b"\nendobj\n")
+
+        # 1 = catalog, 2 = page tree, 3 = font; pages start at 4
+        next_id = [4]
+
+        def flush_page(lines):
+            content = [f"BT /F1 {font_size} Tf {font_size + 2} TL 36 559 Td".encode('latin-1')]
+            for line in lines:
+                content.append(f"({pdf_text(line)}) Tj T*".encode('latin-1'))
+            content.append(b"ET")
+            stream = b"\n".join(content)
+            content_id, page_id = next_id[0], next_id[0] + 1
+            next_id[0] += 2
+            write_object(content_id, f"<< /Length {len(stream)} >>\nstream\n".encode('latin-1') + stream + b"\nendstream")
+            write_object(page_id, f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 842 595] "
+                                  f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>".encode('latin-1'))
+            page_ids.append(page_id)
+
+        file.write(b"%PDF-1.4\n")
+        write_object(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier >>")
+
+        header_lines = [title, f"Generated {datetime.now().strftime('%Y-%m-%d %H:%M')}", ""]
+        lines = list(header_lines)
+        column_header = None
+        for i, row in enumerate(rows):
+            line = " ".join(str('' if v is None else v)[:column_width].ljust(column_width) for v in row).rstrip()
+            if i == 0:
+                column_header = [line, "-" * len(line)]
+                lines.extend(column_header)
+                continue
+            if len(lines) >= lines_per_page:
+                flush_page(lines)
+                lines = list(column_header)
+            lines.append(line)
+        flush_page(lines)
+
+        kids = " ".join(f"{p} 0 R" for p in page_ids)
+        write_object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode('latin-1'))
+        write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+        xref_offset = file.tell()
+        count = max(offsets) + 1
+        file.write(f"xref\n0 {count}\n0000000000 65535 f \n".encode('latin-1'))
+        for obj_id in range(1, count):
+            file.write(f"{offsets[obj_id]:010d} 00000 n \n".encode('latin-1'))
+        file.write(f"trailer\n<< /Size {count} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode('latin-1'))
+
+
+def _run_report_job(files, template, params, fmt, out_path):
+    """Builds one report in a worker process and returns its path."""
+    store = LibraryTables(*files)
+    title, source = REPORT_TEMPLATES[template]
+    tmp_path = out_path + ".tmp"
+    writer = _write_xlsx if fmt == 'xlsx' else _write_pdf
+    writer(tmp_path, title, source(store, params))
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+class ReportEngine:
+    """Builds reports in a worker process and caches them by data generation.
+
+    A finished report is stored under a name derived from its template,
+    parameters, format and the store's generation, so asking again before the
+    data changes returns the existing file without doing any work. Date
+    defaults such as the overdue report's as_of are filled in first, so a
+    report asked for on a new day is built fresh. Once a new generation of a
+    report is written, the files of older generations are deleted.
+    """
+
+    def __init__(self, store, report_dir="reports"):
+        self.store = store
+        self.report_dir = report_dir
+        self._executor = None
+        self._pending = {}
+        self._timers = []
+
+    def report_path(self, template, fmt, params, defaults=None):
+        """File for a report: named by the requested params, tagged with the data generation and defaults."""
+        key = json.dumps([template, fmt, sorted(params.items())])
+        variant = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+        tag = self.store.generation()
+        if defaults:
+            tag = hashlib.sha1(json.dumps([tag, sorted(defaults.items())]).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.report_dir, f"{template}-{variant}-{tag}.{fmt}")
+
+    def _remove_older(self, path):
+        """Deletes files of the same report built from earlier data generations."""
+        prefix, fmt = os.path.basename(path).rsplit('-', 1)[0] + '-', os.path.splitext(path)[1]
+        for name in os.listdir(self.report_dir):
+            other = os.path.join(self.report_dir, name)
+            if name.startswith(prefix) and name.endswith(fmt) and other != path:
+                try:
+                    os.remove(other)
+                except OSError:
+                    pass
+
+    def _finished(self, path, future):
+        self._pending.pop(path, None)
+        if not future.cancelled() and future.exception() is None:
+            self._remove_older(path)
+
+    def request(self, template, fmt="xlsx", **params):
+        """Returns a Future for the report's file path."""
+        if template not in REPORT_TEMPLATES:
+            raise ValueError(f"Unknown report template: {template}")
+        if fmt not in REPORT_FORMATS:
+            raise ValueError(f"Unknown report format: {fmt}")
+        defaults = {}
+        if template == 'overdue' and not params.get('as_of'):
+            # Resolved here, not in the worker, so the cached file is tied to the day it covers
+            defaults['as_of'] = date.today().isoformat()
+        path = self.report_path(template, fmt, params, defaults)
+        params = dict(params, **defaults)
+        if os.path.exists(path):
+            future = Future()
+            future.set_result(path)
+            return future
+        pending = self._pending.get(path)
+        if pending is not None:
+            return pending
+        os.makedirs(self.report_dir, exist_ok=True)
+        if self._executor is None:
+            # Spawned, not forked, so the worker never inherits the Tk connection
+            self._executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+        files = (self.store.books_file, self.store.members_file, self.store.borrowings_file, self.store.snapshot_file)
+        future = self._executor.submit(_run_report_job, files, template, params, fmt, path)
+        self._pending[path] = future
+        future.add_done_callback(lambda done: self._finished(path, done))
+        return future
+
+    def schedule(self, template, fmt, interval_seconds, **params):
+        """Requests the report now and then every interval_seconds until shutdown()."""
+        def run():
+            self.request(template, fmt, **params)
+            timer = threading.Timer(interval_seconds, run)
+            timer.daemon = True
+            self._timers = [t for t in self._timers if t.is_alive()] + [timer]
+            timer.start()
+        run()
+
+    def shutdown(self, wait=True):
+        """Stops scheduled reports and the worker process once queued reports are done."""
+        for timer in self._timers:
+            timer.cancel()
+        self._timers = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
 
 # Login Window 
 class LoginWindow:
-    def __init__(self, master):
+    def __init__(self, master, app=None):
         self.master = master
+        # Main window of an earlier session, hidden while logged out and resumed on login
+        self.app = app
         master.title("Library System Login")
         master.geometry("400x250")
         master.configure(bg="#f0f0f0")
         master.resizable(False, False)
 
-        self.username = "admin"
-        self.password = "admin123"
+        self.users = UserStore.open()
+
+        self.frame = tk.Frame(master, bg="#f0f0f0")
+        self.frame.pack(expand=True, fill="both")
 
-        tk.Label(master, text="Library Management System", font=("Arial", 14, "bold"), bg="#f0f0f0").pack(pady=10)
+        tk.Label(self.frame, text="Library Management System", font=("Arial", 14, "bold"), bg="#f0f0f0").pack(pady=10)
 
-        tk.Label(master, text="Username:", bg="#f0f0f0").pack(pady=(8, 2))
-        self.username_entry = tk.Entry(master, width=30)
+        tk.Label(self.frame, text="Username:", bg="#f0f0f0").pack(pady=(8, 2))
+        self.username_entry = tk.Entry(self.frame, width=30)
         self.username_entry.pack()
 
-        tk.Label(master, text="Password:", bg="#f0f0f0").pack(pady=(8, 2))
-        self.password_entry = tk.Entry(master, width=30, show="*")
+        tk.Label(self.frame, text="Password:", bg="#f0f0f0").pack(pady=(8, 2))
+        self.password_entry = tk.Entry(self.frame, width=30, show="*")
         self.password_entry.pack()
 
-        self.login_btn = tk.Button(master, text="Login", command=self.check_login, bg="#4CAF50", fg="white", width=15)
+        self.login_btn = tk.Button(self.frame, text="Login", command=self.check_login, bg="#4CAF50", fg="white", width=15)
         self.login_btn.pack(pady=15)
 
         self.username_entry.focus()
@@ -35,11 +2181,13 @@ class LoginWindow:
         user = self.username_entry.get().strip()
         pwd = self.password_entry.get().strip()
 
-        if user == self.username and pwd == self.password:
-            self.master.destroy()  # Close login window
-            root = tk.Tk()
-            LibraryManagementSystem(root)  # Open main system
-            root.mainloop()
+        token = self.users.authenticate(user, pwd)
+        if token:
+            self.frame.destroy()  # Close login screen
+            if self.app is not None:
+                self.app.resume(token)  # Show the main system built by an earlier login
+            else:
+                LibraryManagementSystem(self.master, token)  # Open main system in the same window
         else:
             messagebox.showerror("Login Failed", "Invalid Username or Password")
 
@@ -47,11 +2195,8 @@ class LoginWindow:
 # Main Library Management System
 class LibraryManagementSystem:
 
-    def __init__(self, master):
+    def __init__(self, master, token):
         self.master = master
-        master.title("Library Management System")
-        master.geometry("1000x700")
-        master.resizable(True, True)
 
         self.primary_color = "#4A90E2"   # Blue
         self.secondary_color = "#8CC63F" # Green
@@ -60,104 +2205,109 @@ class LibraryManagementSystem:
         self.text_color = "#333333"      # Dark Gray
         self.header_bg = "#E0E5EB"       # Header Gray
 
-        master.configure(bg=self.bg_color)
-
-        self.books_file = "books.csv"
-        self.members_file = "members.csv"
-        self.borrowings_file = "borrowings.csv"
-
-        self.books = []
-        self.members = []
-        self.borrowings = []
-
-        self._load_data()
+        # Shared across logins, so re-login does not reload the CSVs
+        self.store = None
+        self._open_store()
+        self.users = UserStore.open()
+        self.token = None
+        self._books_fill_job = None
 
-        # Compute next IDs
-        self.next_book_id = self._get_next_id(self.books)
-        self.next_member_id = self._get_next_id(self.members)
-        self.next_borrowing_id = self._get_next_id(self.borrowings)
+        # Everything lives in one frame that is hidden, not destroyed, on logout
+        self.frame = tk.Frame(master, bg=self.bg_color)
 
         # Top bar with logout
-        topbar = tk.Frame(master, bg=self.bg_color)
+        topbar = tk.Frame(self.frame, bg=self.bg_color)
         topbar.pack(fill="x")
         logout_btn = tk.Button(
             topbar, text="Logout", command=self.logout,
             bg="red", fg="white", font=("Arial", 10, "bold")
         )
-        logout_btn.pack(anchor="e", padx=10, pady=10)
+        logout_btn.pack(side="right", padx=10, pady=10)
+        self.user_label = tk.Label(topbar, bg=self.bg_color, fg=self.text_color)
+        self.user_label.pack(side="right", padx=5)
 
         # Build UI
         self._create_widgets()
+        self.resume(token)
+
+    def _open_store(self):
+        """Opens the shared store; returns True if it is not the one already shown."""
+        store = LibraryStore.open()
+        if store is self.store:
+            return False
+        self.store = store
+        self.reports = ReportEngine(store)
+        self.recommender = store.recommendations()
+        store.enable_notifications()
+        return True
+
+    def resume(self, token):
+        """Shows the main window for a session, reusing the widgets built by an earlier login."""
+        # The trees still show the last session's data; refill only if the CSVs changed since
+        store_changed = self._open_store()
+        self.token = token
+        identity = self.users.verify_token(token)
+        self.store.actor = identity['username']
+        self.user_label.config(text=f"Logged in as {identity['username']} ({identity['role']})")
+
+        self.master.title("Library Management System")
+        self.master.geometry("1000x700")
+        self.master.resizable(True, True)
+        self.master.configure(bg=self.bg_color)
+        self.frame.pack(expand=True, fill="both")
+        if store_changed:
+            self._on_tab_change(None)
+
+    @property
+    def books(self):
+        return self.store.books
+
+    @books.setter
+    def books(self, value):
+        self.store.books = value
+
+    @property
+    def members(self):
+        return self.store.members
+
+    @members.setter
+    def members(self, value):
+        self.store.members = value
+
+    @property
+    def borrowings(self):
+        return self.store.borrowings
+
+    @borrowings.setter
+    def borrowings(self, value):
+        self.store.borrowings = value
 
     def logout(self):
         """Logs out and returns to the login screen."""
-        self.master.destroy()
-        root = tk.Tk()
-        LoginWindow(root)
-        root.mainloop()
-
-    def _load_data(self):
-        """Loads data from CSV files into memory."""
-        self.books = self._load_csv(self.books_file)
-        self.members = self._load_csv(self.members_file)
-        self.borrowings = self._load_csv(self.borrowings_file)
+        self.users.revoke(self.token)
+        self.reports.shutdown(wait=False)
+        self.frame.pack_forget()
+        LoginWindow(self.master, app=self)
+
+    def _require_role(self, role, action):
+        """Checks the session for a role, telling the user if it is missing."""
+        if self.users.has_role(self.token, role):
+            return True
+        if self.users.verify_token(self.token) is None:
+            messagebox.showerror("Session Expired", "Your session has expired. Please log in again.")
+        else:
+            messagebox.showerror("Permission Denied", f"Only {role} users can {action}.")
+        return False
 
     def _save_data(self):
         """Saves current data from memory to CSV files."""
-        self._save_csv(self.books_file, self.books, ['id', 'title', 'author', 'isbn', 'published_year', 'status'])
-        self._save_csv(self.members_file, self.members, ['id', 'name', 'email', 'phone'])
-        self._save_csv(self.borrowings_file, self.borrowings, ['id', 'book_id', 'member_id', 'borrow_date', 'return_date'])
-
-    def _load_csv(self, filename):
-        """Helper to load data from a single CSV file."""
-        data = []
-        if os.path.exists(filename):
-            with open(filename, mode='r', newline='', encoding='utf-8') as file:
-                reader = csv.DictReader(file)
-                for row in reader:
-                    # Normalize and cast fields
-                    if 'id' in row and row['id'] != '':
-                        row['id'] = int(row['id'])
-                    if 'book_id' in row and row['book_id'] != '':
-                        row['book_id'] = int(row['book_id'])
-                    if 'member_id' in row and row['member_id'] != '':
-                        row['member_id'] = int(row['member_id'])
-                    if 'published_year' in row and row['published_year']:
-                        try:
-                            row['published_year'] = int(row['published_year'])
-                        except ValueError:
-                            row['published_year'] = None
-                    if 'return_date' in row and (row['return_date'] == 'None' or row['return_date'] == ''):
-                        row['return_date'] = None
-                    data.append(row)
-        return data
-
-    def _save_csv(self, filename, data, headers):
-        """Helper to save data to a single CSV file with provided headers."""
-        # Ensure file exists with headers even if empty
-        with open(filename, mode='w', newline='', encoding='utf-8') as file:
-            writer = csv.DictWriter(file, fieldnames=headers)
-            writer.writeheader()
-            for item in data:
-                row = {}
-                for h in headers:
-                    v = item.get(h, "")
-                    if h == 'return_date' and v is None:
-                        v = None
-                    row[h] = v
-                writer.writerow(row)
-
-    def _get_next_id(self, data_list):
-        """Generates the next available ID for a list of dictionaries."""
-        if not data_list:
-            return 1
-        return max(int(item['id']) for item in data_list if 'id' in item) + 1
+        self.store.save()
 
     #  UI Construction 
     def _create_widgets(self):
         """Creates all the GUI elements for the application."""
         # Notebook for tabs
-        self.notebook = ttk.Notebook(self.master)
+        self.notebook = ttk.Notebook(self.frame)
         self.notebook.pack(expand=True, fill="both", padx=10, pady=10)
 
         # Style for ttk widgets
@@ -183,38 +2333,52 @@ class LibraryManagementSystem:
         style.configure("Treeview", font=('Arial', 9), rowheight=25, background="white", foreground=self.text_color, fieldbackground="white")
         style.map('Treeview', background=[('selected', self.primary_color)])
 
+        # Tab frames are added empty; their contents are built on first view
+        self.built_tabs = set()
+
         # --- Books Tab ---
         self.books_frame = ttk.Frame(self.notebook, padding="15")
         self.notebook.add(self.books_frame, text="Books")
-        self._create_books_tab(self.books_frame)
 
         # --- Members Tab ---
         self.members_frame = ttk.Frame(self.notebook, padding="15")
         self.notebook.add(self.members_frame, text="Members")
-        self._create_members_tab(self.members_frame)
 
         # --- Borrow/Return Tab ---
         self.borrow_return_frame = ttk.Frame(self.notebook, padding="15")
         self.notebook.add(self.borrow_return_frame, text="Borrow/Return")
-        self._create_borrow_return_tab(self.borrow_return_frame)
 
         # --- All Borrowings Tab ---
         self.all_borrowings_frame = ttk.Frame(self.notebook, padding="15")
         self.notebook.add(self.all_borrowings_frame, text="All Borrowings")
-        self._create_all_borrowings_tab(self.all_borrowings_frame)
 
-        # Populate initial views
-        self._populate_books_treeview()
-        self._populate_members_treeview()
-        self._populate_borrow_return_treeview()
-        self._populate_all_borrowings_treeview()
+        # --- Reports Tab ---
+        self.reports_frame = ttk.Frame(self.notebook, padding="15")
+        self.notebook.add(self.reports_frame, text="Reports")
 
-        # Refresh data on tab change
+        self.tab_builders = {
+            "Books": (self.books_frame, self._create_books_tab),
+            "Members": (self.members_frame, self._create_members_tab),
+            "Borrow/Return": (self.borrow_return_frame, self._create_borrow_return_tab),
+            "All Borrowings": (self.all_borrowings_frame, self._create_all_borrowings_tab),
+            "Reports": (self.reports_frame, self._create_reports_tab),
+        }
+
+        # Build and refresh tabs on tab change (also fires for the initial tab)
         self.notebook.bind("<<NotebookTabChanged>>", self._on_tab_change)
 
+    def _build_tab(self, tab_name):
+        """Builds a tab's widgets the first time it is shown."""
+        if tab_name in self.built_tabs:
+            return
+        self.built_tabs.add(tab_name)
+        frame, builder = self.tab_builders[tab_name]
+        builder(frame)
+
     def _on_tab_change(self, event):
         """Refreshes data in the current tab's Treeview when tab changes."""
         selected_tab = self.notebook.tab(self.notebook.select(), "text")
+        self._build_tab(selected_tab)
         if selected_tab == "Books":
             self._populate_books_treeview()
         elif selected_tab == "Members":
@@ -253,6 +2417,9 @@ class LibraryManagementSystem:
         self.clear_book_form_btn = ttk.Button(button_frame, text="Clear Form", command=self._clear_book_form)
         self.clear_book_form_btn.pack(side="left", padx=5)
 
+        self.book_recommendations_label = ttk.Label(form_frame, text="", wraplength=850)
+        self.book_recommendations_label.grid(row=len(labels) + 1, column=0, columnspan=2, sticky="w", padx=5)
+
         self.books_tree = ttk.Treeview(parent_frame, columns=("ID", "Title", "Author", "ISBN", "Year", "Status"), show="headings")
         self.books_tree.pack(pady=10, padx=10, fill="both", expand=True)
 
@@ -279,19 +2446,33 @@ class LibraryManagementSystem:
         action_button_frame = ttk.Frame(parent_frame)
         action_button_frame.pack(pady=5, padx=10, fill="x", anchor="e")
 
-        self.delete_book_btn = ttk.Button(action_button_frame, text="Delete Selected Book", command=self._delete_book)
+        self.delete_book_btn = ttk.Button(action_button_frame, text="Delete Selected Book(s)", command=self._delete_book)
         self.delete_book_btn.pack(side="right", padx=5)
 
     def _populate_books_treeview(self):
-        """Populates the books Treeview with current data."""
-        for i in self.books_tree.get_children():
-            self.books_tree.delete(i)
+        """Populates the books Treeview with current data.
 
-        for book in self.books:
+        Rows go in TREE_FILL_CHUNK at a time between events, so a large catalog
+        never freezes the window; a new call replaces a fill still in progress.
+        """
+        if "Books" not in self.built_tabs:
+            return
+        if self._books_fill_job is not None:
+            self.master.after_cancel(self._books_fill_job)
+            self._books_fill_job = None
+        self.books_tree.delete(*self.books_tree.get_children())
+        self._fill_books_treeview(list(self.books), 0)
+
+    def _fill_books_treeview(self, books, start):
+        """Inserts one chunk of books and schedules the next."""
+        self._books_fill_job = None
+        for book in books[start:start + TREE_FILL_CHUNK]:
             self.books_tree.insert("", "end", iid=book['id'], values=(
                 book['id'], book.get('title', ''), book.get('author', ''), book.get('isbn', ''),
                 book.get('published_year', ''), str(book.get('status', 'available')).capitalize()
             ))
+        if start + TREE_FILL_CHUNK < len(books):
+            self._books_fill_job = self.master.after(1, self._fill_books_treeview, books, start + TREE_FILL_CHUNK)
 
     def _on_book_select(self, event):
         """Populates the book form when a book is selected in the Treeview."""
@@ -312,6 +2493,10 @@ class LibraryManagementSystem:
             self.book_entries['published_year'].insert(0, selected_book.get('published_year', ''))
             self.selected_book_id = book_id
 
+            titles = self.store.titles_for(self.recommender.similar_books(book_id))
+            if titles:
+                self.book_recommendations_label.config(text="Members who borrowed this also borrowed: " + "; ".join(titles))
+
             self.add_book_btn.config(state=tk.DISABLED)
             self.update_book_btn.config(state=tk.NORMAL)
         else:
@@ -323,6 +2508,7 @@ class LibraryManagementSystem:
         """Clears all entry fields in the book form."""
         for entry in self.book_entries.values():
             entry.delete(0, tk.END)
+        self.book_recommendations_label.config(text="")
         self.selected_book_id = None
         self.add_book_btn.config(state=tk.NORMAL)
         self.update_book_btn.config(state=tk.DISABLED)
@@ -357,7 +2543,7 @@ class LibraryManagementSystem:
             return
 
         new_book = {
-            'id': self.next_book_id,
+            'id': self.store.next_id('books'),
             'title': title,
             'author': author,
             'isbn': isbn,
@@ -365,7 +2551,7 @@ class LibraryManagementSystem:
             'status': 'available'
         }
         self.books.append(new_book)
-        self.next_book_id += 1
+        self.store.record_change('book', 'add', new_book['id'], None, dict(new_book))
         self._save_data()
         self._populate_books_treeview()
         self._clear_book_form()
@@ -403,10 +2589,12 @@ class LibraryManagementSystem:
 
         for book in self.books:
             if int(book['id']) == book_id_to_update:
+                before = dict(book)
                 book['title'] = title
                 book['author'] = author
                 book['isbn'] = isbn
                 book['published_year'] = published_year
+                self.store.record_change('book', 'update', book_id_to_update, before, dict(book))
                 break
 
         self._save_data()
@@ -415,24 +2603,36 @@ class LibraryManagementSystem:
         messagebox.showinfo("Success", f"Book ID {book_id_to_update} updated successfully!")
 
     def _delete_book(self):
-        """Deletes the selected book from the system."""
-        selected_item = self.books_tree.focus()
-        if not selected_item:
+        """Deletes the selected books from the system."""
+        if not self._require_role('admin', "delete books"):
+            return
+        selected_items = self.books_tree.selection()
+        if not selected_items:
             messagebox.showerror("Error", "No book selected for deletion.")
             return
 
-        book_id_to_delete = int(self.books_tree.item(selected_item, "values")[0])
+        book_ids = [int(self.books_tree.item(i, "values")[0]) for i in selected_items]
 
-        if any(int(b['book_id']) == book_id_to_delete and b['return_date'] is None for b in self.borrowings):
-            messagebox.showerror("Deletion Error", "This book is currently borrowed and cannot be deleted.")
+        report = self.store.delete_books(book_ids, dry_run=True)
+        if not report.deleted:
+            if len(book_ids) == 1:
+                messagebox.showerror("Deletion Error", "This book is currently borrowed and cannot be deleted.")
+            else:
+                messagebox.showerror("Deletion Error", "All selected books are currently borrowed and cannot be deleted.")
             return
 
-        if messagebox.askyesno("Confirm Deletion", f"Are you sure you want to delete Book ID {book_id_to_delete}?"):
-            self.books = [book for book in self.books if int(book['id']) != book_id_to_delete]
-            self._save_data()
-            self._populate_books_treeview()
+        if len(report.deleted) == 1:
+            prompt = f"Are you sure you want to delete Book ID {report.deleted[0]}?"
+        else:
+            prompt = f"Are you sure you want to delete {len(report.deleted)} books?"
+        if report.blocked:
+            prompt += f"\n\n{len(report.blocked)} borrowed book(s) will be skipped."
+
+        if messagebox.askyesno("Confirm Deletion", prompt):
+            report = self.store.delete_books(report.deleted)
+            self.books_tree.delete(*[i for i in report.deleted if self.books_tree.exists(i)])
             self._clear_book_form()
-            messagebox.showinfo("Success", f"Book ID {book_id_to_delete} deleted successfully.")
+            messagebox.showinfo("Success", report.summary())
 
     # Members Tab
     def _create_members_tab(self, parent_frame):
@@ -463,6 +2663,9 @@ class LibraryManagementSystem:
         self.clear_member_form_btn = ttk.Button(button_frame, text="Clear Form", command=self._clear_member_form)
         self.clear_member_form_btn.pack(side="left", padx=5)
 
+        self.member_recommendations_label = ttk.Label(form_frame, text="", wraplength=850)
+        self.member_recommendations_label.grid(row=len(labels) + 1, column=0, columnspan=2, sticky="w", padx=5)
+
         self.members_tree = ttk.Treeview(parent_frame, columns=("ID", "Name", "Email", "Phone"), show="headings")
         self.members_tree.pack(pady=10, padx=10, fill="both", expand=True)
 
@@ -485,11 +2688,16 @@ class LibraryManagementSystem:
         action_button_frame = ttk.Frame(parent_frame)
         action_button_frame.pack(pady=5, padx=10, fill="x", anchor="e")
 
-        self.delete_member_btn = ttk.Button(action_button_frame, text="Delete Selected Member", command=self._delete_member)
+        self.delete_member_btn = ttk.Button(action_button_frame, text="Delete Selected Member(s)", command=self._delete_member)
         self.delete_member_btn.pack(side="right", padx=5)
 
+        self.purge_members_btn = ttk.Button(action_button_frame, text="Purge Inactive Members", command=self._purge_members)
+        self.purge_members_btn.pack(side="right", padx=5)
+
     def _populate_members_treeview(self):
         """Populates the members Treeview with current data."""
+        if "Members" not in self.built_tabs:
+            return
         for i in self.members_tree.get_children():
             self.members_tree.delete(i)
 
@@ -516,6 +2724,10 @@ class LibraryManagementSystem:
             self.member_entries['phone'].insert(0, selected_member.get('phone', ''))
             self.selected_member_id = member_id
 
+            titles = self.store.titles_for(self.recommender.for_member(member_id))
+            if titles:
+                self.member_recommendations_label.config(text="Suggested for this member: " + "; ".join(titles))
+
             self.add_member_btn.config(state=tk.DISABLED)
             self.update_member_btn.config(state=tk.NORMAL)
         else:
@@ -527,6 +2739,7 @@ class LibraryManagementSystem:
         """Clears all entry fields in the member form."""
         for entry in self.member_entries.values():
             entry.delete(0, tk.END)
+        self.member_recommendations_label.config(text="")
         self.selected_member_id = None
         self.add_member_btn.config(state=tk.NORMAL)
         self.update_member_btn.config(state=tk.DISABLED)
@@ -556,13 +2769,13 @@ class LibraryManagementSystem:
             return
 
         new_member = {
-            'id': self.next_member_id,
+            'id': self.store.next_id('members'),
             'name': name,
             'email': email,
             'phone': phone
         }
         self.members.append(new_member)
-        self.next_member_id += 1
+        self.store.record_change('member', 'add', new_member['id'], None, dict(new_member))
         self._save_data()
         self._populate_members_treeview()
         self._clear_member_form()
@@ -593,9 +2806,11 @@ class LibraryManagementSystem:
 
         for member in self.members:
             if int(member['id']) == member_id_to_update:
+                before = dict(member)
                 member['name'] = name
                 member['email'] = email
                 member['phone'] = phone
+                self.store.record_change('member', 'update', member_id_to_update, before, dict(member))
                 break
 
         self._save_data()
@@ -604,24 +2819,65 @@ class LibraryManagementSystem:
         messagebox.showinfo("Success", f"Member ID {member_id_to_update} updated successfully!")
 
     def _delete_member(self):
-        """Deletes the selected member from the system."""
-        selected_item = self.members_tree.focus()
-        if not selected_item:
+        """Deletes the selected members from the system."""
+        if not self._require_role('admin', "delete members"):
+            return
+        selected_items = self.members_tree.selection()
+        if not selected_items:
             messagebox.showerror("Error", "No member selected for deletion.")
             return
 
-        member_id_to_delete = int(self.members_tree.item(selected_item, "values")[0])
+        member_ids = [int(self.members_tree.item(i, "values")[0]) for i in selected_items]
 
-        if any(int(b['member_id']) == member_id_to_delete and b['return_date'] is None for b in self.borrowings):
-            messagebox.showerror("Deletion Error", "This member has outstanding borrowed books and cannot be deleted.")
+        report = self.store.delete_members(member_ids, dry_run=True)
+        if not report.deleted:
+            if len(member_ids) == 1:
+                messagebox.showerror("Deletion Error", "This member has outstanding borrowed books and cannot be deleted.")
+            else:
+                messagebox.showerror("Deletion Error", "All selected members have outstanding borrowed books and cannot be deleted.")
             return
 
-        if messagebox.askyesno("Confirm Deletion", f"Are you sure you want to delete Member ID {member_id_to_delete}?"):
-            self.members = [m for m in self.members if int(m['id']) != member_id_to_delete]
-            self._save_data()
-            self._populate_members_treeview()
-            self._clear_member_form()
-            messagebox.showinfo("Success", f"Member ID {member_id_to_delete} deleted successfully.")
+        if len(report.deleted) == 1:
+            prompt = f"Are you sure you want to delete Member ID {report.deleted[0]}?"
+        else:
+            prompt = f"Are you sure you want to delete {len(report.deleted)} members?"
+        if report.blocked:
+            prompt += f"\n\n{len(report.blocked)} member(s) with outstanding books will be skipped."
+
+        if messagebox.askyesno("Confirm Deletion", prompt):
+            self._apply_member_deletion(report.deleted)
+
+    def _purge_members(self):
+        """Deletes every member who has not borrowed anything since a chosen date."""
+        if not self._require_role('admin', "purge members"):
+            return
+        before_date = simpledialog.askstring(
+            "Purge Inactive Members", "Purge members with no borrowing since (YYYY-MM-DD):", parent=self.master)
+        if not before_date:
+            return
+        try:
+            datetime.strptime(before_date.strip(), "%Y-%m-%d")
+        except ValueError:
+            messagebox.showerror("Input Error", "Please enter the date as YYYY-MM-DD.")
+            return
+        include_never_borrowed = messagebox.askyesno(
+            "Purge Inactive Members", "Also purge members who have never borrowed anything?", default=messagebox.NO)
+
+        report = self.store.purge_inactive_members(before_date.strip(), dry_run=True,
+                                                   include_never_borrowed=include_never_borrowed)
+        if not report.deleted:
+            messagebox.showinfo("Purge", "No inactive members found.")
+            return
+
+        if messagebox.askyesno("Confirm Purge", report.summary() + "\n\nProceed?"):
+            self._apply_member_deletion(report.deleted)
+
+    def _apply_member_deletion(self, member_ids):
+        """Deletes members through the store and removes their rows from the Treeview."""
+        report = self.store.delete_members(member_ids)
+        self.members_tree.delete(*[i for i in report.deleted if self.members_tree.exists(i)])
+        self._clear_member_form()
+        messagebox.showinfo("Success", report.summary())
 
     # Borrow / Return Tab
     def _create_borrow_return_tab(self, parent_frame):
@@ -679,6 +2935,8 @@ class LibraryManagementSystem:
 
     def _update_borrow_comboboxes(self):
         """Populates the book and member comboboxes for borrowing/returning."""
+        if "Borrow/Return" not in self.built_tabs:
+            return
         # Books available to borrow
         available_books = [f"{b['id']} - {b.get('title','')} by {b.get('author','')} (ISBN: {b.get('isbn','')})"
                            for b in self.books if str(b.get('status', 'available')) == 'available']
@@ -714,6 +2972,8 @@ class LibraryManagementSystem:
 
     def _populate_borrow_return_treeview(self):
         """Populates the Treeview with currently borrowed books."""
+        if "Borrow/Return" not in self.built_tabs:
+            return
         for i in self.borrow_return_tree.get_children():
             self.borrow_return_tree.delete(i)
 
@@ -756,17 +3016,19 @@ class LibraryManagementSystem:
         borrow_date = datetime.now().strftime("%Y-%m-%d")
 
         new_borrowing = {
-            'id': self.next_borrowing_id,
+            'id': self.store.next_id('borrowings'),
             'book_id': book_id,
             'member_id': member_id,
             'borrow_date': borrow_date,
             'return_date': None
         }
         self.borrowings.append(new_borrowing)
-        self.next_borrowing_id += 1
+        self.store.record_change('loan', 'borrow', new_borrowing['id'], None, dict(new_borrowing))
 
         # Update book status
+        before = dict(book_to_borrow)
         book_to_borrow['status'] = 'borrowed'
+        self.store.record_change('book', 'update', book_id, before, dict(book_to_borrow))
 
         self._save_data()
         self._populate_books_treeview()
@@ -807,8 +3069,13 @@ class LibraryManagementSystem:
             return
 
         return_date = datetime.now().strftime("%Y-%m-%d")
+        before = dict(borrowing_to_return)
         borrowing_to_return['return_date'] = return_date
+        self.store.record_change('loan', 'return', borrowing_id, before, dict(borrowing_to_return))
+
+        before = dict(book_object)
         book_object['status'] = 'available'
+        self.store.record_change('book', 'update', book_id, before, dict(book_object))
 
         self._save_data()
         self._populate_books_treeview()
@@ -852,6 +3119,8 @@ class LibraryManagementSystem:
 
     def _populate_all_borrowings_treeview(self):
         """Populates the Treeview with all borrowing records."""
+        if "All Borrowings" not in self.built_tabs:
+            return
         for i in self.all_borrowings_tree.get_children():
             self.all_borrowings_tree.delete(i)
 
@@ -873,9 +3142,292 @@ class LibraryManagementSystem:
                     b_rec.get('borrow_date', ''), return_date_display, status
                 ))
 
+    # Reports Tab
+    def _create_reports_tab(self, parent_frame):
+        """Creates UI elements for the Reports tab."""
+        form_frame = ttk.LabelFrame(parent_frame, text="Generate Report", padding="15")
+        form_frame.pack(pady=10, padx=10, fill="x")
+
+        self.report_titles = {title: name for name, (title, _) in REPORT_TEMPLATES.items()}
+
+        ttk.Label(form_frame, text="Report:").grid(row=0, column=0, sticky="w", pady=5, padx=5)
+        self.report_template_combo = ttk.Combobox(form_frame, width=40, state="readonly", values=list(self.report_titles))
+        self.report_template_combo.grid(row=0, column=1, sticky="ew", pady=5, padx=5)
+        self.report_template_combo.set(next(iter(self.report_titles)))
+
+        ttk.Label(form_frame, text="Format:").grid(row=1, column=0, sticky="w", pady=5, padx=5)
+        self.report_format_combo = ttk.Combobox(form_frame, width=40, state="readonly", values=[f.upper() for f in REPORT_FORMATS])
+        self.report_format_combo.grid(row=1, column=1, sticky="ew", pady=5, padx=5)
+        self.report_format_combo.set(REPORT_FORMATS[0].upper())
+
+        form_frame.grid_columnconfigure(1, weight=1)
+
+        self.generate_report_btn = ttk.Button(form_frame, text="Generate Report", command=self._generate_report)
+        self.generate_report_btn.grid(row=2, column=0, columnspan=2, pady=10)
+
+        self.report_status = ttk.Label(parent_frame, text="")
+        self.report_status.pack(pady=10, padx=10, anchor="w")
+
+        integrity_frame = ttk.LabelFrame(parent_frame, text="Data Integrity", padding="15")
+        integrity_frame.pack(pady=10, padx=10, fill="both", expand=True)
+
+        button_frame = ttk.Frame(integrity_frame)
+        button_frame.pack(fill="x")
+        ttk.Button(button_frame, text="Check Data", command=self._check_integrity).pack(side="left", padx=5)
+        ttk.Button(button_frame, text="Repair Data", command=self._repair_integrity).pack(side="left", padx=5)
+
+        self.integrity_tree = ttk.Treeview(integrity_frame, columns=("Issue", "Record", "Detail"), show="headings")
+        self.integrity_tree.pack(pady=10, fill="both", expand=True)
+
+        self.integrity_tree.heading("Issue", text="Issue")
+        self.integrity_tree.heading("Record", text="Record")
+        self.integrity_tree.heading("Detail", text="Detail")
+
+        self.integrity_tree.column("Issue", width=140, stretch=tk.NO)
+        self.integrity_tree.column("Record", width=140, stretch=tk.NO)
+        self.integrity_tree.column("Detail", width=500, stretch=tk.YES)
+
+    def _show_integrity_report(self, report):
+        """Lists a check's issues in the integrity Treeview."""
+        for i in self.integrity_tree.get_children():
+            self.integrity_tree.delete(i)
+        for kind, subject, detail in report.issues:
+            self.integrity_tree.insert("", "end", values=(kind.replace('_', ' ').capitalize(), subject, detail))
+
+    def _check_integrity(self):
+        """Re-checks the data, only looking at rows changed since the last check."""
+        report = self.store.integrity.check()
+        self._show_integrity_report(report)
+        if not report.issues:
+            messagebox.showinfo("Data Integrity", "No problems found.")
+
+    def _repair_integrity(self):
+        """Applies the automatic repairs and shows what was changed."""
+        if not self._require_role('admin', "repair data"):
+            return
+        if not messagebox.askyesno("Confirm Repair", "Close conflicting or orphaned open loans and fix book statuses?"):
+            return
+        report = self.store.integrity.repair()
+        self._show_integrity_report(report)
+        messagebox.showinfo("Data Integrity", "\n".join(report.repairs) if report.repairs else "Nothing could be repaired automatically.")
+
+    def _generate_report(self):
+        """Queues the chosen report in the worker process and waits for it without blocking the UI."""
+        title = self.report_template_combo.get()
+        fmt = self.report_format_combo.get().lower()
+        future = self.reports.request(self.report_titles[title], fmt)
+        self.report_status.config(text=f"Generating '{title}'...")
+        self._poll_report(future, title)
+
+    def _poll_report(self, future, title):
+        """Checks on a queued report every 200 ms until it is done."""
+        if not future.done():
+            self.master.after(200, self._poll_report, future, title)
+            return
+        try:
+            path = future.result()
+            text = f"'{title}' saved to {os.path.abspath(path)}"
+        except Exception as e:
+            text = f"'{title}' failed: {e}"
+        try:
+            self.report_status.config(text=text)
+        except tk.TclError:
+            pass  # Logged out while the report was running
+
+
+# Command Line
+def main(argv=None):
+    """Runs a maintenance command if one is given, otherwise starts the GUI."""
+    parser = argparse.ArgumentParser(description="Library Management System")
+    parser.add_argument("--token", default=os.environ.get("LIBRARY_TOKEN"),
+                        help="Session token from 'login' (defaults to $LIBRARY_TOKEN)")
+    commands = parser.add_subparsers(dest="command")
+
+    login = commands.add_parser("login", help="Print a session token for use with --token / $LIBRARY_TOKEN")
+    login.add_argument("username")
+
+    useradd = commands.add_parser("useradd", help="Create or reset a staff account (admin only)")
+    useradd.add_argument("username")
+    useradd.add_argument("--role", choices=ROLES, default="staff")
+
+    userdel = commands.add_parser("userdel", help="Remove a staff account (admin only)")
+    userdel.add_argument("username")
+
+    delete_books = commands.add_parser("delete-books", help="Delete books by id")
+    delete_books.add_argument("ids", nargs="+", type=int)
+    delete_books.add_argument("--dry-run", action="store_true", help="Only report what would be deleted or blocked")
+
+    delete_members = commands.add_parser("delete-members", help="Delete members by id")
+    delete_members.add_argument("ids", nargs="+", type=int)
+    delete_members.add_argument("--dry-run", action="store_true", help="Only report what would be deleted or blocked")
+
+    purge_members = commands.add_parser("purge-members", help="Delete members with no borrowing since a date")
+    purge_members.add_argument("--before", required=True, help="Cut-off date, YYYY-MM-DD")
+    purge_members.add_argument("--dry-run", action="store_true", help="Only report what would be deleted or blocked")
+    purge_members.add_argument("--include-never-borrowed", action="store_true",
+                               help="Also delete members who have never borrowed anything")
+
+    make_report = commands.add_parser("report", help="Generate a report file")
+    make_report.add_argument("template", choices=sorted(REPORT_TEMPLATES))
+    make_report.add_argument("--format", choices=REPORT_FORMATS, default="xlsx")
+    make_report.add_argument("--as-of", help="Overdue: date to compute overdue days for, YYYY-MM-DD (default today)")
+    make_report.add_argument("--loan-days", type=int, help=f"Overdue: loan period in days (default {LOAN_PERIOD_DAYS})")
+    make_report.add_argument("--period", choices=["day", "month", "year"], help="Circulation: grouping (default month)")
+    make_report.add_argument("--start", help="Circulation: first date, YYYY-MM-DD")
+    make_report.add_argument("--end", help="Circulation: last date, YYYY-MM-DD")
+    make_report.add_argument("--every", type=float, help="Keep running and regenerate every N minutes")
+
+    recommend = commands.add_parser("recommend", help="Suggest books for a book or a member")
+    recommend.add_argument("entity", choices=["book", "member"])
+    recommend.add_argument("id", type=int)
+    recommend.add_argument("-n", type=int, default=5, help="Number of suggestions")
+
+    dispatch = commands.add_parser("dispatch", help="Deliver queued member notifications")
+    dispatch.add_argument("--transport", choices=["file", "smtp"], default="file")
+    dispatch.add_argument("--sink", default="sent_mail", help="Directory for the file transport")
+    dispatch.add_argument("--smtp-host", default="localhost")
+    dispatch.add_argument("--smtp-port", type=int, default=25)
+    dispatch.add_argument("--smtp-user")
+    dispatch.add_argument("--starttls", action="store_true")
+    dispatch.add_argument("--sender", default="library@localhost")
+    dispatch.add_argument("--rate", type=float, default=OUTBOX_RATE_PER_SECOND, help="Messages per second")
+    dispatch.add_argument("--once", action="store_true", help="Deliver what is due now and exit")
+
+    check = commands.add_parser("check", help="Check the tables for contradictions")
+    check.add_argument("--repair", action="store_true", help="Apply the automatic repairs (admin only)")
+
+    audit = commands.add_parser("audit", help="Show the change history of a record, or its state at a time")
+    audit.add_argument("entity", choices=["book", "member", "loan"])
+    audit.add_argument("id", type=int)
+    audit.add_argument("--at", help="ISO date/time to rebuild the record as of, e.g. 2025-09-05T14:30")
+
+    args = parser.parse_args(argv)
+
+    if args.command is None:
+        root = tk.Tk()
+        LoginWindow(root)
+        root.mainloop()
+        LibraryStore.shutdown()
+        return 0
+
+    users = UserStore.open()
+    if args.command == "login":
+        token = users.authenticate(args.username, getpass.getpass("Password: "))
+        if token is None:
+            print("Invalid username or password.")
+            return 1
+        print(token)
+        return 0
+
+    identity = users.verify_token(args.token)
+    if identity is None:
+        print("A valid session token is required; run 'login' and pass it with --token or $LIBRARY_TOKEN.")
+        return 1
+    destructive = ("useradd", "userdel", "delete-books", "delete-members", "purge-members")
+    if args.command == "check" and args.repair and identity['role'] != 'admin':
+        print("Only admin users can repair data.")
+        return 1
+    if args.command in destructive and identity['role'] != 'admin' and not getattr(args, 'dry_run', False):
+        print(f"Only admin users can run '{args.command}'.")
+        return 1
+
+    if args.command == "useradd":
+        password = getpass.getpass("New password: ")
+        if password != getpass.getpass("Repeat password: "):
+            print("Passwords do not match.")
+            return 1
+        users.add_user(args.username, password, role=args.role)
+        print(f"User '{args.username}' saved with role {args.role}.")
+        return 0
+    if args.command == "userdel":
+        users.remove_user(args.username)
+        print(f"User '{args.username}' removed.")
+        return 0
+
+    store = LibraryStore.open()
+    store.actor = identity['username']
+    if args.command == "audit":
+        if args.at:
+            print(json.dumps(store.audit.record_at(args.entity, args.id, datetime.fromisoformat(args.at))))
+        else:
+            for timestamp, event in store.audit.history(args.entity, args.id):
+                when = datetime.fromtimestamp(timestamp).isoformat(sep=' ', timespec='seconds')
+                print(f"{when}  {event['actor']:<12} {event['action']:<7} {json.dumps(event['before'])} -> {json.dumps(event['after'])}")
+        LibraryStore.shutdown()
+        return 0
+    if args.command == "dispatch":
+        if args.transport == "smtp":
+            password = getpass.getpass("SMTP password: ") if args.smtp_user else None
+            transport = SmtpTransport(args.smtp_host, args.smtp_port, args.sender,
+                                      args.smtp_user, password, args.starttls)
+        else:
+            transport = FileSinkTransport(args.sink, args.sender)
+        outbox = Outbox()
+        dispatcher = OutboxDispatcher(outbox, transport, rate_per_second=args.rate)
+        try:
+            if args.once:
+                handled = 0
+                count = dispatcher.run_once()
+                while count:
+                    handled += count
+                    count = dispatcher.run_once()
+                print(f"Handled {handled} message(s); {len(outbox.pending)} still queued.")
+            else:
+                dispatcher.run_forever()
+        except KeyboardInterrupt:
+            pass
+        outbox.compact()
+        return 0
+    if args.command == "recommend":
+        recommender = Recommender(store)
+        recommender.rebuild()
+        if args.entity == "book":
+            book_ids = recommender.similar_books(args.id, args.n)
+        else:
+            book_ids = recommender.for_member(args.id, args.n)
+        books = {int(b['id']): b for b in store.books}
+        for book_id in book_ids:
+            if book_id in books:
+                print(f"{book_id} - {books[book_id].get('title', '')} by {books[book_id].get('author', '')}")
+        LibraryStore.shutdown()
+        return 0
+    if args.command == "check":
+        report = store.integrity.repair() if args.repair else store.integrity.check()
+        print(report.summary())
+        LibraryStore.shutdown()
+        return 1 if report.issues else 0
+    if args.command == "report":
+        params = {k: v for k, v in (('as_of', args.as_of), ('loan_days', args.loan_days), ('period', args.period),
+                                    ('start', args.start), ('end', args.end)) if v is not None}
+        engine = ReportEngine(store)
+        try:
+            if args.every:
+                engine.schedule(args.template, args.format, args.every * 60, **params)
+                while True:
+                    time.sleep(3600)
+            print(engine.request(args.template, args.format, **params).result())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            engine.shutdown()
+            LibraryStore.shutdown()
+        return 0
+    if args.command == "delete-books":
+        report = store.delete_books(args.ids, dry_run=args.dry_run)
+    elif args.command == "delete-members":
+        report = store.delete_members(args.ids, dry_run=args.dry_run)
+    else:
+        try:
+            report = store.purge_inactive_members(args.before, dry_run=args.dry_run,
+                                                  include_never_borrowed=args.include_never_borrowed)
+        except ValueError as e:
+            print(e)
+            return 1
+    print(report.summary())
+    LibraryStore.shutdown()
+    return 0
+
 
 # Start Program 
 if __name__ == "__main__":
-    root = tk.Tk()
-    LoginWindow(root)
-    root.mainloop()
+    raise SystemExit(main())
@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """An empty LibraryStore whose files all live in a temporary directory."""
+    monkeypatch.chdir(tmp_path)
+    store = app.LibraryStore()
+    yield store
+    store.audit.close()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replaces time.time() with a clock that only moves when advanced."""
+    class Clock:
+        now = 1_700_000_000.0
+
+        def __call__(self):
+            return self.now
+
+        def advance(self, seconds=1.0):
+            self.now += seconds
+            return self.now
+
+    fake = Clock()
+    monkeypatch.setattr(app.time, "time", fake)
+    return fake
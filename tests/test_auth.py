@@ -0,0 +1,54 @@
+import app
+
+
+def stores(tmp_path):
+    files = (str(tmp_path / "users.csv"), str(tmp_path / "session.key"), str(tmp_path / "session.revoked"))
+    return app.UserStore(*files), app.UserStore(*files)
+
+
+def test_password_reset_elsewhere_ends_cached_logins_and_sessions(tmp_path):
+    desk, cli = stores(tmp_path)
+    token = desk.authenticate('admin', 'admin123')
+    assert desk.verify_token(token)
+
+    cli.add_user('admin', 'changed', role='admin')
+
+    assert not desk.check_password('admin', 'admin123')
+    assert desk.verify_token(token) is None
+    assert desk.check_password('admin', 'changed')
+
+
+def test_new_removed_and_demoted_accounts_reach_a_running_desk(tmp_path):
+    desk, cli = stores(tmp_path)
+    cli.add_user('bob', 'secret')
+    token = desk.authenticate('bob', 'secret')
+    assert desk.verify_token(token)['role'] == 'staff'
+
+    cli.users['bob']['role'] = 'admin'
+    cli._save()
+    assert desk.verify_token(token) is None
+
+    cli.remove_user('bob')
+    assert desk.authenticate('bob', 'secret') is None
+
+
+def test_logout_in_one_process_revokes_the_token_everywhere(tmp_path):
+    desk, cli = stores(tmp_path)
+    token = cli.authenticate('admin', 'admin123')
+    assert desk.verify_token(token)
+    cli.revoke(token)
+    assert desk.verify_token(token) is None
+    assert app.UserStore(desk.users_file, desk.key_file, desk.revoked_file).verify_token(token) is None
+
+
+def test_unknown_usernames_cost_as_much_as_wrong_passwords(tmp_path, monkeypatch):
+    desk, _ = stores(tmp_path)
+    assert desk.check_password('admin', 'admin123')
+    hashes = []
+    original = desk._hash_password
+    monkeypatch.setattr(desk, "_hash_password", lambda *args, **kw: hashes.append(args) or original(*args, **kw))
+
+    assert not desk.check_password('nobody', 'guess')
+    assert not desk.check_password('admin', 'guess')     # wrong password after a cached login
+    assert desk.check_password('admin', 'admin123')      # cached, no scrypt
+    assert len(hashes) == 2
@@ -0,0 +1,68 @@
+import csv
+import io
+
+import pytest
+
+import app
+
+
+def write_rows(path, rows):
+    with open(path, mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(['id', 'title', 'author'])
+        writer.writerows(rows)
+
+
+def tricky_rows(count):
+    """Rows whose quoted fields hold newlines, quotes and commas."""
+    rows = []
+    for i in range(1, count + 1):
+        title = f'Line one\nline "two" of {i}' if i % 3 else f'Plain {i}'
+        author = 'Doe, "J"\n\nJr.' if i % 4 == 0 else 'Smith'
+        rows.append([str(i), title, author])
+    return rows
+
+
+def records_in_ranges(path, ranges):
+    with open(path, mode='rb') as file:
+        data = file.read()
+    records = []
+    for start, end in ranges:
+        text = data[start:end].decode('utf-8')
+        records.extend(r for r in csv.reader(io.StringIO(text, newline='')) if r)
+    return records
+
+
+@pytest.mark.parametrize("chunk_bytes", [1, 5, 13, 29, 64, 200, 10_000])
+def test_chunks_never_split_quoted_newlines(tmp_path, chunk_bytes):
+    path = tmp_path / "books.csv"
+    rows = tricky_rows(60)
+    write_rows(path, rows)
+
+    headers, ranges = app._csv_chunks(str(path), chunk_bytes=chunk_bytes)
+
+    assert headers == ['id', 'title', 'author']
+    size = path.stat().st_size
+    assert ranges[-1][1] == size
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+    assert records_in_ranges(path, ranges) == rows
+
+
+def test_chunk_edge_inside_a_quoted_field(tmp_path):
+    path = tmp_path / "books.csv"
+    write_rows(path, [['1', 'a\nb\nc\nd', 'x'], ['2', 'e', 'y']])
+    with open(path, mode='rb') as file:
+        data = file.read()
+    # Ends the first chunk right after the newline between "a" and "b"
+    chunk_bytes = data.index(b'a\n') + 2 - data.index(b'\n') - 1
+
+    _, ranges = app._csv_chunks(str(path), chunk_bytes=chunk_bytes)
+
+    assert records_in_ranges(path, ranges) == [['1', 'a\nb\nc\nd', 'x'], ['2', 'e', 'y']]
+    assert all(data[end - 1:end] == b'\n' for _, end in ranges)
+
+
+def test_header_only_file_has_no_chunks(tmp_path):
+    path = tmp_path / "books.csv"
+    write_rows(path, [])
+    assert app._csv_chunks(str(path)) == (['id', 'title', 'author'], [])
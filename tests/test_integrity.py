@@ -0,0 +1,120 @@
+import random
+
+import app
+
+
+def change(store, entity, table, row_id, **fields):
+    rows = getattr(store, table)
+    row = next((r for r in rows if r['id'] == row_id), None)
+    before = None if row is None else dict(row)
+    if fields.get('deleted'):
+        rows.remove(row)
+        store.record_change(entity, 'delete', row_id, before, None)
+        return
+    if row is None:
+        row = {'id': row_id}
+        rows.append(row)
+    row.update(fields)
+    store.record_change(entity, 'update' if before else 'add', row_id, before, dict(row))
+
+
+def seed(store):
+    for i in range(1, 6):
+        change(store, 'book', 'books', i, title=f"B{i}", isbn=f"isbn-{i}", status='available')
+        change(store, 'member', 'members', i, name=f"M{i}", email=f"m{i}@example.com")
+    change(store, 'loan', 'borrowings', 1, book_id=1, member_id=1, borrow_date='2025-01-01', return_date=None)
+    change(store, 'book', 'books', 1, status='borrowed')
+
+
+def test_clean_store_has_no_issues(store):
+    seed(store)
+    assert store.integrity.check().issues == []
+
+
+def test_incremental_check_finds_new_issues_and_clears_fixed_ones(store):
+    seed(store)
+    assert store.integrity.check(full=True).issues == []
+
+    change(store, 'book', 'books', 2, isbn='isbn-3')
+    change(store, 'loan', 'borrowings', 2, book_id=1, member_id=2, borrow_date='2025-01-02', return_date=None)
+    change(store, 'member', 'members', 4, deleted=True)
+    change(store, 'loan', 'borrowings', 3, book_id=5, member_id=4, borrow_date='2025-01-03', return_date=None)
+
+    report = store.integrity.check()
+    assert not report.full
+    assert {(kind, subject) for kind, subject, _ in report.issues} == {
+        ('duplicate_isbn', 'isbn isbn-3'),
+        ('double_loan', 'book 1'),
+        ('orphaned_loan', 'loan 3'),
+        ('status_mismatch', 'book 5'),
+    }
+    assert report.issues == store.integrity.check(full=True).issues
+
+    change(store, 'book', 'books', 2, isbn='isbn-2')
+    change(store, 'loan', 'borrowings', 2, return_date='2025-01-05')
+    report = store.integrity.check()
+    assert {kind for kind, _, _ in report.issues} == {'orphaned_loan', 'status_mismatch'}
+
+
+def test_incremental_matches_full_after_random_changes(store):
+    rng = random.Random(7)
+    seed(store)
+    store.integrity.check()
+    for step in range(300):
+        kind = rng.choice(['book', 'member', 'loan'])
+        row_id = rng.randint(1, 8)
+        if kind == 'book':
+            if rng.random() < 0.15 and any(b['id'] == row_id for b in store.books):
+                change(store, 'book', 'books', row_id, deleted=True)
+            else:
+                change(store, 'book', 'books', row_id, isbn=f"isbn-{rng.randint(1, 6)}",
+                       status=rng.choice(['available', 'borrowed']))
+        elif kind == 'member':
+            if rng.random() < 0.15 and any(m['id'] == row_id for m in store.members):
+                change(store, 'member', 'members', row_id, deleted=True)
+            else:
+                change(store, 'member', 'members', row_id, email=f"m{rng.randint(1, 6)}@example.com")
+        else:
+            change(store, 'loan', 'borrowings', row_id, book_id=rng.randint(1, 8), member_id=rng.randint(1, 8),
+                   borrow_date='2025-02-01', return_date=rng.choice([None, '2025-02-10']))
+        if step % 25 == 0:
+            incremental = store.integrity.check()
+            assert not incremental.full
+            assert incremental.issues == store.integrity.check(full=True).issues
+
+
+def test_repair_leaves_only_issues_that_need_a_person(store):
+    seed(store)
+    change(store, 'loan', 'borrowings', 2, book_id=1, member_id=2, borrow_date='2025-01-02', return_date=None)
+    change(store, 'book', 'books', 3, status='borrowed')
+    change(store, 'book', 'books', 4, isbn='isbn-5')
+
+    report = store.integrity.repair(today='2025-03-01')
+
+    assert [kind for kind, _, _ in report.issues] == ['duplicate_isbn']
+    loans = {b['id']: b for b in store.borrowings}
+    assert loans[1]['return_date'] == '2025-01-02'
+    assert loans[2]['return_date'] is None
+    assert next(b for b in store.books if b['id'] == 3)['status'] == 'available'
+
+    # Repairs are saved
+    reloaded = app.LibraryStore(store.books_file, store.members_file, store.borrowings_file)
+    reloaded.audit.close()
+    assert [(b['id'], b['status']) for b in reloaded.books] == [(b['id'], b['status']) for b in store.books]
+    assert [b['return_date'] for b in reloaded.borrowings] == [b['return_date'] for b in store.borrowings]
+
+
+def test_returned_loans_of_deleted_records_are_history_not_issues(store):
+    seed(store)
+    change(store, 'loan', 'borrowings', 2, book_id=2, member_id=3, borrow_date='2024-01-01', return_date='2024-01-10')
+    store.save()
+    assert store.integrity.check(full=True).issues == []
+
+    assert store.delete_books([2]).deleted == [2]
+    assert store.delete_members([3]).deleted == [3]
+    report = store.integrity.check()
+
+    assert report.issues == []
+    assert [(kind, subject) for kind, subject, _ in report.notes] == [('deleted_reference', 'loan 2')]
+    assert "deleted book 2" in report.notes[0][2] and "deleted member 3" in report.notes[0][2]
+    assert store.integrity.repair().repairs == []
@@ -0,0 +1,191 @@
+import json
+
+import app
+
+
+class FlakyTransport:
+    """Records sends; fails the first `failures` attempts for each message."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.attempts = {}
+        self.sent = []
+
+    def open(self):
+        pass
+
+    def send(self, message_id, to, subject, body):
+        self.attempts[message_id] = self.attempts.get(message_id, 0) + 1
+        if self.attempts[message_id] <= self.failures:
+            raise OSError("mail server unavailable")
+        self.sent.append((message_id, to, subject))
+
+    def close(self):
+        pass
+
+
+def seed_loan(store):
+    store.books.append({'id': 1, 'title': 'Dune', 'author': 'Herbert', 'isbn': '1', 'status': 'borrowed'})
+    store.members.append({'id': 1, 'name': 'Ann', 'email': 'ann@example.com', 'phone': ''})
+    loan = {'id': 1, 'book_id': 1, 'member_id': 1, 'borrow_date': '2025-01-01', 'return_date': None}
+    store.borrowings.append(loan)
+    return loan
+
+
+def dispatcher(store, outbox, transport):
+    return app.OutboxDispatcher(outbox, transport, rate_per_second=0, store_opener=lambda: store)
+
+
+def test_duplicate_enqueues_are_dropped_on_replay(tmp_path):
+    desk = app.Outbox(str(tmp_path / "outbox.log"))
+    other_desk = app.Outbox(str(tmp_path / "outbox.log"))
+    desk.enqueue('receipt', dedup_key='receipt:1', loan_id=1)
+    other_desk.enqueue('receipt', dedup_key='receipt:1', loan_id=1)
+    desk.enqueue('receipt', dedup_key='receipt:2', loan_id=2)
+
+    replay = app.Outbox(str(tmp_path / "outbox.log"))
+    replay.refresh()
+    assert sorted(m['dedup_key'] for m in replay.pending.values()) == ['receipt:1', 'receipt:2']
+
+
+def test_enqueue_does_not_read_the_journal(tmp_path):
+    path = tmp_path / "outbox.log"
+    path.write_bytes(b"not json\n")
+    desk = app.Outbox(str(path))
+    desk.enqueue('receipt', dedup_key='receipt:1')
+    desk.cancel('receipt:1')
+    assert desk.pending == {} and desk.keys == {}
+    assert [json.loads(line)['op'] for line in path.read_bytes().splitlines()[1:]] == ['enqueue', 'cancel']
+
+
+def test_delivered_key_is_not_queued_again(tmp_path):
+    outbox = app.Outbox(str(tmp_path / "outbox.log"))
+    outbox.enqueue('receipt', dedup_key='receipt:1')
+    outbox.refresh()
+    [message] = outbox.due(now=app.time.time() + 1)
+    outbox.mark_results([message['id']], {})
+
+    outbox.enqueue('receipt', dedup_key='receipt:1')
+    outbox.refresh()
+    assert outbox.pending == {}
+
+    # Compaction keeps the delivered key, so a later duplicate is still dropped
+    outbox.compact()
+    outbox.enqueue('receipt', dedup_key='receipt:1')
+    fresh = app.Outbox(outbox.filename)
+    fresh.refresh()
+    assert fresh.pending == {} and 'receipt:1' in fresh.keys
+
+
+def test_cancel_by_key_drops_only_pending_messages(tmp_path):
+    outbox = app.Outbox(str(tmp_path / "outbox.log"))
+    outbox.enqueue('due_reminder', dedup_key='due_reminder:1')
+    outbox.enqueue('overdue', dedup_key='overdue:1')
+    outbox.cancel('due_reminder:1', 'overdue:1', 'unknown:9')
+    outbox.refresh()
+    assert outbox.pending == {} and outbox.keys == {}
+
+    # A cancelled key may be queued again
+    outbox.enqueue('overdue', dedup_key='overdue:1')
+    outbox.refresh()
+    assert [m['kind'] for m in outbox.pending.values()] == ['overdue']
+
+
+def test_partial_line_is_read_once_complete(tmp_path):
+    outbox = app.Outbox(str(tmp_path / "outbox.log"))
+    line = json.dumps({'op': 'enqueue', 'message': {'id': 'a', 'kind': 'receipt', 'dedup_key': 'k',
+                                                     'not_before': 0, 'attempts': 0, 'next_attempt': 0}})
+    with open(outbox.filename, mode='w') as file:
+        file.write(line[:20])
+    outbox.refresh()
+    assert outbox.pending == {}
+    with open(outbox.filename, mode='a') as file:
+        file.write(line[20:] + "\n")
+    outbox.refresh()
+    assert list(outbox.pending) == ['a']
+
+
+def test_loan_queues_notifications_and_return_cancels_reminders(store):
+    outbox = store.enable_notifications()
+    loan = seed_loan(store)
+    store.record_change('loan', 'borrow', 1, None, dict(loan))
+    dispatch = app.Outbox(outbox.filename)
+    dispatch.refresh()
+    assert sorted(m['kind'] for m in dispatch.pending.values()) == ['due_reminder', 'overdue', 'receipt']
+
+    before = dict(loan)
+    loan['return_date'] = '2025-01-05'
+    store.record_change('loan', 'return', 1, before, dict(loan))
+    dispatch.refresh()
+    assert [m['kind'] for m in dispatch.pending.values()] == ['receipt']
+
+
+def test_failed_sends_are_retried_with_backoff_then_delivered(store, clock):
+    outbox = app.Outbox("outbox.log")
+    seed_loan(store)
+    outbox.enqueue('receipt', dedup_key='receipt:1', loan_id=1, member_id=1, book_id=1, due_date='2025-01-15')
+    transport = FlakyTransport(failures=2)
+    sender = dispatcher(store, outbox, transport)
+
+    assert sender.run_once() == 1
+    [message] = outbox.pending.values()
+    assert message['attempts'] == 1
+    assert message['next_attempt'] == clock.now + app.OUTBOX_BACKOFF_SECONDS
+    assert sender.run_once() == 0    # backing off
+
+    clock.advance(app.OUTBOX_BACKOFF_SECONDS)
+    assert sender.run_once() == 1
+    assert outbox.pending[message['id']]['attempts'] == 2
+
+    clock.advance(2 * app.OUTBOX_BACKOFF_SECONDS)
+    assert sender.run_once() == 1
+    assert outbox.pending == {}
+    assert transport.sent == [(message['id'], 'ann@example.com', "You borrowed 'Dune'")]
+
+
+def test_message_is_dropped_after_max_attempts(store, clock):
+    outbox = app.Outbox("outbox.log")
+    seed_loan(store)
+    outbox.enqueue('receipt', dedup_key='receipt:1', loan_id=1, member_id=1, book_id=1, due_date='2025-01-15')
+    sender = dispatcher(store, outbox, FlakyTransport(failures=app.OUTBOX_MAX_ATTEMPTS))
+    for _ in range(app.OUTBOX_MAX_ATTEMPTS):
+        assert sender.run_once() == 1
+        clock.advance(app.OUTBOX_BACKOFF_SECONDS * 2 ** app.OUTBOX_MAX_ATTEMPTS)
+    assert outbox.pending == {}
+    assert 'receipt:1' not in outbox.keys
+
+
+def test_message_for_rows_not_yet_loaded_is_retried_not_dropped(store, clock, monkeypatch):
+    monkeypatch.setattr(app.LibraryStore, "_open_stores", {})
+    store.books.append({'id': 1, 'title': 'Dune', 'author': 'Herbert', 'isbn': '1', 'status': 'borrowed'})
+    store.save()
+    outbox = app.Outbox("outbox.log")
+    outbox.enqueue('receipt', dedup_key='receipt:1', loan_id=1, member_id=1, book_id=1, due_date='2025-01-15')
+    transport = FlakyTransport()
+    sender = app.OutboxDispatcher(outbox, transport, rate_per_second=0, store_opener=app.LibraryStore.open)
+
+    assert sender.run_once() == 1
+    assert transport.sent == []
+    [message] = outbox.pending.values()
+    assert message['attempts'] == 1 and 'not found' in message['last_error']
+    assert 'receipt:1' in outbox.keys and isinstance(outbox.keys['receipt:1'], str)
+
+    # The desk saves the new member and loan; the next attempt reloads and delivers
+    seed_loan(store)
+    store.books.pop(0)
+    store.save()
+    clock.advance(app.OUTBOX_BACKOFF_SECONDS)
+    assert sender.run_once() == 1
+    assert [to for _, to, _ in transport.sent] == ['ann@example.com']
+    assert outbox.pending == {}
+
+
+def test_reminder_for_a_returned_loan_is_dropped_without_sending(store, clock):
+    outbox = app.Outbox("outbox.log")
+    loan = seed_loan(store)
+    loan['return_date'] = '2025-01-03'
+    outbox.enqueue('due_reminder', dedup_key='due_reminder:1', loan_id=1, member_id=1, book_id=1,
+                   due_date='2025-01-15')
+    transport = FlakyTransport()
+    assert dispatcher(store, outbox, transport).run_once() == 1
+    assert transport.sent == [] and outbox.pending == {}
@@ -0,0 +1,78 @@
+import random
+
+import app
+
+
+class LoanLog:
+    """Just enough of a store for the Recommender: loans plus change listeners."""
+
+    def __init__(self):
+        self.borrowings = []
+        self.listeners = []
+
+    def borrow(self, member_id, book_id):
+        loan = {'id': len(self.borrowings) + 1, 'member_id': member_id, 'book_id': book_id, 'return_date': None}
+        self.borrowings.append(loan)
+        for listener in self.listeners:
+            listener('loan', 'borrow', loan['id'], None, dict(loan))
+
+
+def rebuilt(log, neighbors):
+    fresh = app.Recommender(LoanLog(), neighbors=neighbors)
+    fresh.store = log
+    fresh.rebuild()
+    return fresh
+
+
+def test_similar_books_and_member_suggestions():
+    log = LoanLog()
+    recommender = app.Recommender(log)
+    recommender.rebuild()
+    for member_id, books in {1: [1, 2, 3], 2: [1, 2], 3: [1, 4]}.items():
+        for book_id in books:
+            log.borrow(member_id, book_id)
+    assert recommender.similar_books(1) == [2, 3, 4]
+    assert recommender.for_member(2) == [3, 4]
+
+
+def test_incremental_updates_match_rebuild_past_the_history_cap(monkeypatch):
+    monkeypatch.setattr(app, "RECOMMENDATION_MAX_HISTORY", 5)
+    rng = random.Random(3)
+    log = LoanLog()
+    recommender = app.Recommender(log, neighbors=3)
+    recommender.rebuild()
+    for _ in range(500):
+        log.borrow(rng.randint(1, 6), rng.randint(1, 30))
+
+    full = rebuilt(log, neighbors=3)
+    assert recommender.member_books == full.member_books
+    assert {k: dict(v) for k, v in recommender.co.items()} == {k: dict(v) for k, v in full.co.items()}
+    assert recommender.neighbors == full.neighbors
+    assert all(len(books) <= 5 for books in recommender.member_books.values())
+
+
+def test_background_rebuild_runs_in_a_worker_and_replays_new_loans(store):
+    store.books = [{'id': i, 'title': f"B{i}", 'status': 'available'} for i in range(1, 6)]
+    store.members = [{'id': i, 'name': f"M{i}", 'email': ''} for i in range(1, 4)]
+    store.borrowings = [{'id': n, 'member_id': m, 'book_id': b, 'borrow_date': '2025-01-01', 'return_date': '2025-01-02'}
+                        for n, (m, b) in enumerate([(1, 1), (1, 2), (2, 1), (2, 3), (3, 2), (3, 4)], start=1)]
+    store.save()
+    recommender = app.Recommender(store)
+    future = recommender.rebuild_async()
+
+    # Recorded (and saved) while the worker may still be counting
+    loan = {'id': 7, 'member_id': 3, 'book_id': 5, 'borrow_date': '2025-01-03', 'return_date': None}
+    store.borrowings.append(loan)
+    store.record_change('loan', 'borrow', 7, None, dict(loan))
+    store.save()
+
+    future.result(timeout=60)
+    deadline = app.time.monotonic() + 10
+    while not recommender.ready and app.time.monotonic() < deadline:
+        app.time.sleep(0.01)
+
+    expected = app.Recommender(store)
+    expected.rebuild()
+    assert recommender.ready
+    assert recommender.member_books == expected.member_books
+    assert recommender.neighbors == expected.neighbors
@@ -0,0 +1,90 @@
+import os
+import re
+import time
+import zipfile
+from xml.etree import ElementTree
+
+import app
+
+SHEET_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+
+
+class Day(app.date):
+    current = app.date(2025, 3, 1)
+
+    @classmethod
+    def today(cls):
+        return cls.current
+
+
+def rows(count=3):
+    yield ["ID", "Title", "Note"]
+    for i in range(1, count + 1):
+        yield [i, f"Book <{i}> & co", 'Quote " and é']
+
+
+def test_xlsx_parts_and_sheet_are_well_formed(tmp_path):
+    path = tmp_path / "report.xlsx"
+    app._write_xlsx(str(path), "Inventory", rows())
+
+    with zipfile.ZipFile(path) as zf:
+        assert zf.testzip() is None
+        parts = {name: ElementTree.fromstring(zf.read(name)) for name in zf.namelist()}
+    assert 'xl/worksheets/sheet1.xml' in parts and '[Content_Types].xml' in parts
+
+    sheet_rows = parts['xl/worksheets/sheet1.xml'].iter(SHEET_NS + "row")
+    values = [["".join(cell.itertext()) for cell in row] for row in sheet_rows]
+    assert values[0] == ["ID", "Title", "Note"]
+    assert values[1] == ["1", "Book <1> & co", 'Quote " and é']
+    assert len(values) == 4
+
+
+def test_pdf_xref_offsets_point_at_their_objects(tmp_path):
+    path = tmp_path / "report.pdf"
+    app._write_pdf(str(path), "Overdue (today)", rows(200))
+    data = path.read_bytes()
+
+    assert data.startswith(b"%PDF-") and data.rstrip().endswith(b"%%EOF")
+    startxref = int(re.search(rb"startxref\s+(\d+)", data).group(1))
+    assert data[startxref:startxref + 4] == b"xref"
+    header = re.match(rb"xref\s+0 (\d+)\s+", data[startxref:])
+    entries = data[startxref + header.end():].split(b"\n")[:int(header.group(1))]
+    for number, entry in enumerate(entries[1:], start=1):
+        offset = int(entry.split()[0])
+        assert data[offset:].startswith(b"%d 0 obj" % number)
+
+
+def test_overdue_report_path_changes_with_the_day(store, monkeypatch):
+    monkeypatch.setattr(app, "date", Day)
+    engine = app.ReportEngine(store)
+    paths = []
+    monkeypatch.setattr(engine, "report_path", lambda *args: paths.append(args) or __file__)
+
+    engine.request('overdue', 'pdf')
+    Day.current = app.date(2025, 3, 2)
+    engine.request('overdue', 'pdf')
+    engine.request('overdue', 'pdf', as_of='2025-01-01')
+
+    assert [args[3] for args in paths] == [{'as_of': '2025-03-01'}, {'as_of': '2025-03-02'}, {}]
+
+
+def test_new_generation_replaces_older_report_files(store):
+    store.books = [{'id': 1, 'title': 'Dune', 'author': 'Herbert', 'isbn': '1', 'published_year': 1965,
+                    'status': 'available'}]
+    store.save()
+    engine = app.ReportEngine(store, report_dir="reports")
+    try:
+        first = engine.request('inventory', 'xlsx').result(timeout=60)
+        other_format = engine.request('inventory', 'pdf').result(timeout=60)
+        assert engine.request('inventory', 'xlsx').result() == first    # cached
+
+        time.sleep(0.01)
+        store.books.append({'id': 2, 'title': 'Emma', 'author': 'Austen', 'isbn': '2', 'published_year': 1815,
+                            'status': 'available'})
+        store.save()
+        second = engine.request('inventory', 'xlsx').result(timeout=60)
+    finally:
+        engine.shutdown()
+
+    assert second != first
+    assert sorted(os.listdir("reports")) == sorted([os.path.basename(second), os.path.basename(other_format)])
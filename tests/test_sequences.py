@@ -0,0 +1,50 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import app
+
+
+def allocate(filename, count):
+    allocator = app.SequenceAllocator(filename, block_size=4)
+    return [allocator.next_id('books', seed=lambda: 1) for _ in range(count)]
+
+
+def test_ids_stay_monotonic_after_deleting_the_highest_row(store):
+    for _ in range(3):
+        book_id = store.next_id('books')
+        store.books.append({'id': book_id, 'title': f"B{book_id}", 'status': 'available'})
+    store.save()
+    highest = max(b['id'] for b in store.books)
+    assert store.delete_books([highest]).deleted == [highest]
+    store.audit.close()
+
+    reopened = app.LibraryStore()
+    reopened.audit.close()
+    assert max(b['id'] for b in reopened.books) < highest
+    assert reopened.next_id('books') > highest
+
+
+def test_seed_runs_only_once(tmp_path):
+    filename = str(tmp_path / "sequences.csv")
+    calls = []
+
+    def seed():
+        calls.append(1)
+        return 100
+
+    first = app.SequenceAllocator(filename, block_size=2)
+    ids = [first.next_id('books', seed=seed) for _ in range(5)]
+    second = app.SequenceAllocator(filename, block_size=2)
+    ids += [second.next_id('books', seed=seed) for _ in range(3)]
+
+    assert calls == [1]
+    assert ids[:5] == [100, 101, 102, 103, 104]
+    assert min(ids[5:]) > 104
+
+
+def test_concurrent_processes_get_disjoint_ids(tmp_path):
+    filename = str(tmp_path / "sequences.csv")
+    with ProcessPoolExecutor(max_workers=4) as pool:
+        batches = list(pool.map(allocate, [filename] * 8, [25] * 8))
+    ids = [i for batch in batches for i in batch]
+    assert len(ids) == len(set(ids)) == 200
+    assert all(batch == sorted(batch) for batch in batches)
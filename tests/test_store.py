@@ -0,0 +1,100 @@
+import pytest
+
+import app
+
+
+def test_purge_keeps_never_borrowed_members_unless_asked(store):
+    store.members = [{'id': i, 'name': f"M{i}", 'email': '', 'phone': ''} for i in (1, 2, 3)]
+    store.borrowings = [
+        {'id': 1, 'book_id': 1, 'member_id': 1, 'borrow_date': '2019-01-01', 'return_date': '2019-02-01'},
+        {'id': 2, 'book_id': 1, 'member_id': 2, 'borrow_date': '2021-01-01', 'return_date': '2021-02-01'},
+    ]
+
+    report = store.purge_inactive_members('2020-01-01', dry_run=True)
+    assert report.deleted == [1]
+    assert report.never_borrowed == [3]
+    assert "Never borrowed (kept): 3" in report.summary()
+
+    report = store.purge_inactive_members('2020-01-01', include_never_borrowed=True)
+    assert report.deleted == [1, 3]
+    assert [m['id'] for m in store.members] == [2]
+
+
+def seed_books(store, count=3):
+    store.books = [{'id': i, 'title': f"B{i}", 'author': 'A', 'isbn': str(i), 'published_year': 2000,
+                    'status': 'available'} for i in range(1, count + 1)]
+    store.save()
+
+
+def reopen(monkeypatch, csv_loads):
+    """A fresh store for the same files, counting CSV parses in csv_loads."""
+    original = app.LibraryStore._load_tables
+
+    def counting(self, stats):
+        csv_loads.append(stats)
+        return original(self, stats)
+
+    monkeypatch.setattr(app.LibraryStore, "_load_tables", counting)
+    store = app.LibraryStore()
+    store.audit.close()
+    return store
+
+
+def test_snapshot_is_used_while_the_csvs_are_unchanged(store, monkeypatch):
+    seed_books(store)
+    store.write_snapshot()
+    loads = []
+    reopened = reopen(monkeypatch, loads)
+    assert loads == []
+    assert reopened.books == store.books
+
+
+def test_snapshot_is_ignored_once_a_csv_changes(store, monkeypatch):
+    seed_books(store)
+    store.write_snapshot()
+    with open(store.books_file, mode='a', newline='', encoding='utf-8') as file:
+        file.write("4,Added elsewhere,B,4,2001,available\r\n")
+    loads = []
+    reopened = reopen(monkeypatch, loads)
+    assert len(loads) == 1
+    assert [b['title'] for b in reopened.books][-1] == "Added elsewhere"
+
+
+def test_open_shares_one_store_until_the_files_change(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(app.LibraryStore, "_open_stores", {})
+    first = app.LibraryStore.open()
+    assert app.LibraryStore.open() is first     # e.g. logout and login again
+
+    seed_books(first)
+    assert app.LibraryStore.open() is first     # its own saves do not count as outside changes
+
+    with open(first.members_file, mode='a', newline='', encoding='utf-8') as file:
+        file.write("9,Walk-in,w@example.com,\r\n")
+    second = app.LibraryStore.open()
+    assert second is not first
+    assert second.members[-1]['name'] == "Walk-in"
+    second.audit.close()
+
+
+def test_delete_report_counts_loan_history_kept(store):
+    store.books = [{'id': i, 'title': f"B{i}", 'status': 'available'} for i in (1, 2)]
+    store.members = [{'id': 1, 'name': 'M1', 'email': '', 'phone': ''}]
+    store.borrowings = [
+        {'id': 1, 'book_id': 1, 'member_id': 1, 'borrow_date': '2024-01-01', 'return_date': '2024-01-05'},
+        {'id': 2, 'book_id': 1, 'member_id': 1, 'borrow_date': '2024-02-01', 'return_date': '2024-02-05'},
+    ]
+    report = store.delete_books([1, 2], dry_run=True)
+    assert report.deleted == [1, 2]
+    assert report.history_loans == 2
+    assert "2 returned loan(s) of these books are kept as history." in report.summary()
+
+
+def test_purge_rejects_a_cutoff_that_is_not_a_date(store):
+    store.members = [{'id': 1, 'name': 'M1', 'email': '', 'phone': ''}]
+    store.borrowings = [{'id': 1, 'book_id': 1, 'member_id': 1, 'borrow_date': '2023-01-01',
+                         'return_date': '2023-01-05'}]
+    for bad in ("Jan 2024", "2024-1-1x", "", "2024-13-01"):
+        with pytest.raises(ValueError):
+            store.purge_inactive_members(bad, dry_run=True)
+    assert store.purge_inactive_members(" 2024-1-1 ", dry_run=True).deleted == [1]